@@ -0,0 +1,60 @@
+"""
+import time of every cog, each in a fresh interpreter
+
+discord.py and red are imported before the clock starts,
+so only the cog's own modules (and qenucore) are measured.
+
+    python benchmarks/import_time.py [tree] [--runs N]
+
+tree defaults to this checkout, point it at an exported older
+revision to compare, e.g. `git archive <rev> | tar -x -C /tmp/old`.
+run `python -m compileall -q <tree>` on both first, otherwise
+bytecode compilation dominates the numbers.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+COGS = ["gateway", "notquitenitro", "qauth", "qenutils", "tcping", "workflow"]
+
+PROBE = """
+import importlib, sys, time
+import discord, redbot.core.bot, redbot.core.commands, redbot.core.config
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[2])
+getattr(module, "__red_end_user_data_statement__", None)
+print(time.perf_counter() - start)
+"""
+
+
+def measure(tree: Path, cog: str, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, str(tree), cog],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(float(output))
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tree", nargs="?", default=Path(__file__).parents[1], type=Path)
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+    total = 0.0
+    for cog in COGS:
+        elapsed = measure(args.tree.resolve(), cog, args.runs)
+        total += elapsed
+        print(f"{cog:<14} {elapsed * 1000:8.2f} ms")
+    print(f"{'total':<14} {total * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
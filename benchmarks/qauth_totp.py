@@ -0,0 +1,54 @@
+"""
+verifications per second of qauth's TOTPVerifier against plain pyotp
+
+    python benchmarks/qauth_totp.py
+"""
+import importlib.util
+import random
+import time
+from pathlib import Path
+
+import pyotp
+
+# load the module on its own, the qauth package itself needs a running red
+spec = importlib.util.spec_from_file_location(
+    "qauth_totp", Path(__file__).parents[1] / "qauth" / "totp.py"
+)
+totp = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(totp)
+
+USERS = 500
+ROUNDS = 20_000
+
+
+def bench(label, verify):
+    secrets = {user_id: pyotp.random_base32() for user_id in range(USERS)}
+    now = time.time()
+    calls = []
+    for index in range(ROUNDS):
+        user_id = random.randrange(USERS)
+        secret = secrets[user_id]
+        # 1 in 10 codes is valid, the rest are wrong guesses
+        code = pyotp.TOTP(secret).at(now) if index % 10 == 0 else "000000"
+        calls.append((user_id, secret, code))
+    start = time.perf_counter()
+    for user_id, secret, code in calls:
+        verify(user_id, secret, code, now)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {ROUNDS / elapsed:>10,.0f} verifies/s")
+
+
+def pyotp_verify(user_id, secret, code, now):
+    return pyotp.TOTP(secret).verify(code, for_time=now, valid_window=1)
+
+
+verifier = totp.TOTPVerifier()
+
+
+def verifier_verify(user_id, secret, code, now):
+    return verifier.verify(user_id=user_id, secret=secret, code=code, now=now)
+
+
+if __name__ == "__main__":
+    bench("pyotp.TOTP", pyotp_verify)
+    bench("TOTPVerifier", verifier_verify)
@@ -0,0 +1,136 @@
+"""
+per-message cost of Qenutils.on_message_without_command
+over a synthetic stream of guild chatter
+
+    python benchmarks/qenutils_on_message.py [tree] [--messages N]
+
+tree defaults to this checkout, compare with an older export,
+e.g. `git archive <rev> | tar -x -C /tmp/old`. discord.py and red
+must be importable, the bot and config are replaced by stand-ins
+whose awaits only yield to the event loop.
+"""
+import argparse
+import asyncio
+import importlib
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BOT_ID = 111111111111111111
+WORDS = (
+    "the a to and is it you that of in for on this was lol yeah what "
+    "why how now lmao nice game play time good bad back base banana "
+    "about bat barn ok gg wp hello there some more words here"
+).split()
+# subscribed keywords, rare in chatter like real highlights
+KEYWORDS = (
+    "deploy outage release qenu gateway webhook todo vault reminder pager "
+    "incident rollback hotfix migration staging"
+).split()
+
+
+async def idle(*args, **kwargs):
+    await asyncio.sleep(0)
+
+
+def synthetic_stream(count: int, seed: int = 0):
+    """
+    mostly plain chatter, about 1% "ba" highlights, 0.5% keyword
+    highlights, 0.5% bare mentions, 5% bots
+    """
+    rng = random.Random(seed)
+    guild = SimpleNamespace(id=1, name="guild", me=None, get_member=lambda _: None)
+    channel = SimpleNamespace(
+        id=2,
+        name="general",
+        permissions_for=lambda _: SimpleNamespace(send_messages=True, read_messages=True),
+    )
+    messages = []
+    for index in range(count):
+        roll = rng.random()
+        if roll < 0.01:
+            content = f"{rng.choice(WORDS)} ba {rng.choice(WORDS)}"
+        elif roll < 0.015:
+            content = f"{rng.choice(WORDS)} {rng.choice(KEYWORDS)} {rng.choice(WORDS)}"
+        elif roll < 0.02:
+            content = f"<@{BOT_ID}>"
+        else:
+            content = " ".join(rng.choices(WORDS, k=rng.randint(1, 20)))
+        author = SimpleNamespace(id=1000 + index % 50, bot=rng.random() < 0.05)
+        messages.append(
+            SimpleNamespace(
+                content=content,
+                author=author,
+                guild=guild,
+                channel=channel,
+                add_reaction=idle,
+                reply=idle,
+            )
+        )
+    return messages
+
+
+def make_cog(module, keywords: int):
+    cog = object.__new__(module.Qenutils)
+
+    async def allowed(*args, **kwargs):
+        await asyncio.sleep(0)
+        return True
+
+    async def get_prefix(message):
+        await asyncio.sleep(0)
+        return ["!", f"<@{BOT_ID}> ", f"<@!{BOT_ID}> "]
+
+    async def embed_colour(*args):
+        return 0
+
+    async def value():
+        return ""
+
+    cog.bot = SimpleNamespace(
+        user=SimpleNamespace(id=BOT_ID),
+        allowed_by_whitelist_blacklist=allowed,
+        get_prefix=get_prefix,
+        get_embed_colour=embed_colour,
+    )
+    cog.config = SimpleNamespace(server_link=value, invite_link=value)
+    cog.highlighted = idle
+    cog._mention_replies = {}
+    if hasattr(module, "HighlightMatcher"):
+        cog.highlights = module.HighlightMatcher()
+        cog.highlights.add(module.AUTHOR_ID, module.HIGHLIGHT_DEFAULT, regex=True)
+        for user_id, keyword in enumerate(KEYWORDS[:keywords], start=1):
+            cog.highlights.add(user_id, keyword)
+        cog.digest = SimpleNamespace(add=lambda *args: None)
+    if hasattr(cog, "_compile_mention"):
+        cog._compile_mention()
+    return cog
+
+
+async def run(cog, messages) -> float:
+    listener = type(cog).on_message_without_command
+    start = time.perf_counter()
+    for message in messages:
+        await listener(cog, message)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tree", nargs="?", default=Path(__file__).parents[1], type=Path)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument(
+        "--keywords", type=int, default=10, help="literal highlight subscriptions"
+    )
+    args = parser.parse_args()
+    sys.path.insert(0, str(args.tree.resolve()))
+    module = importlib.import_module("qenutils.qenutils")
+    messages = synthetic_stream(args.messages)
+    elapsed = min(asyncio.run(run(make_cog(module, args.keywords), messages)) for _ in range(5))
+    print(f"{args.messages} messages  {elapsed / args.messages * 1e6:.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 import asyncio
+import contextlib
 import logging
 import random
 import string
-from typing import Literal
+from functools import partial
+from typing import Dict, FrozenSet, List, Literal, Optional, Set, Tuple
 
+import aiohttp
 import discord
 from discord.ext import tasks
 from redbot.core import commands
@@ -12,8 +15,16 @@ from redbot.core.config import Config
 
 from . import utils
 
+try:
+    from cog_shared.qenucore import GREEN_TICK, pool
+except ImportError:
+    from qenucore import GREEN_TICK, pool
+
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
 _log = logging.getLogger("red.qenu.gateway")
+WEBHOOK_NAME = "qenu.gateway"
+RELAY_BUFFER = 100  # pending messages kept per destination
+BATCH_WINDOW = 1.5  # seconds a batch stays open after its first message
 
 
 class Gateway(commands.Cog):
@@ -28,8 +39,68 @@ class Gateway(commands.Cog):
             identifier=0x11694CAB731712FC,
             force_registration=True,
         )
-        default_global = {"enabled": False, "ports": (None, None), "webhook": False}
+        default_global = {
+            "enabled": False,
+            "ports": (None, None),  # legacy, migrated into the "default" bridge
+            "webhook": False,
+            "batch": False,
+            "mirror_size": 1000,  # relayed messages remembered for edits/deletes
+            "webhooks": {},  # channel id -> {"id": webhook id, "token": webhook token}
+        }
         self.config.register_global(**default_global)
+        self.config.init_custom("BRIDGE", 1)
+        self.config.register_custom("BRIDGE", channels=[])
+
+        self.session = aiohttp.ClientSession()
+
+        # settings snapshot for on_message_without_command, see refresh_settings
+        self._use_webhook: bool = False
+        self._use_batch: bool = False
+        self._bridges: Dict[str, Tuple[int, ...]] = {}
+        # source channel id -> destination channel ids, empty while disabled
+        self._routes: Dict[int, FrozenSet[int]] = {}
+        self._queues: Dict[int, utils.RelayQueue] = {}
+        self._batchers: Dict[int, utils.MessageBatcher] = {}
+        self._relayed = utils.RelayMap()
+        self.attachments = utils.AttachmentPipeline(self.session)
+
+    async def initialize(self) -> None:
+        """migrates the old single bridge, then loads the settings snapshot"""
+        ports = await self.config.ports()
+        if None not in ports:
+            await self.config.custom("BRIDGE", "default").channels.set(list(ports))
+            await self.config.ports.clear()
+        await self.refresh_settings()
+
+    async def refresh_settings(self) -> None:
+        """reloads the in-memory settings snapshot and routing table from config"""
+        data = await self.config.all()
+        bridges = await self.config.custom("BRIDGE").all()
+        self._use_webhook = data["webhook"]
+        self._use_batch = data["batch"]
+        self._relayed.maxsize = data["mirror_size"]
+        self._bridges = {
+            name: tuple(bridge["channels"]) for name, bridge in bridges.items()
+        }
+        routes: Dict[int, Set[int]] = {}
+        if data["enabled"]:
+            for channels in self._bridges.values():
+                for source in channels:
+                    routes.setdefault(source, set()).update(
+                        channel for channel in channels if channel != source
+                    )
+        self._routes = {
+            source: frozenset(destinations)
+            for source, destinations in routes.items()
+            if destinations
+        }
+
+    def cog_unload(self):
+        for batcher in self._batchers.values():
+            batcher.close()
+        for queue in self._queues.values():
+            queue.close()
+        asyncio.create_task(self.session.close())
 
     async def red_delete_data_for_user(
         self, *, requester: RequestType, user_id: int
@@ -48,38 +119,31 @@ class Gateway(commands.Cog):
                 title="Gateway Status",
                 description=(
                     f"Connection is currently **{'enabled' if await self.config.enabled() else 'disabled'}**.\n"
-                    f"Sending gateway using **{'webhooks' if await self.config.webhook() else 'embeds'}**."
+                    f"Sending gateway using **{'webhooks' if await self.config.webhook() else 'embeds'}**.\n"
+                    f"Batching is **{'enabled' if self._use_batch else 'disabled'}**."
                 ),
                 color=await ctx.embed_color(),
             )
-            ports = await self.config.ports()
-            port_0 = self.bot.get_channel(ports[0])
-            port_1 = self.bot.get_channel(ports[1])
-
-            emb.add_field(
-                name="Orange Portal",
-                value=(
-                    "```\n"
-                    f"Guild: {port_0.guild.name if isinstance(port_0, discord.TextChannel) else 'None'}\n"
-                    f"Channel: {port_0.name if isinstance(port_0, discord.TextChannel) else 'None'}\n"
-                    "```"
-                ),
-            )
-            emb.add_field(
-                name="Blue Portal",
-                value=(
-                    "```\n"
-                    f"Guild: {port_1.guild.name if isinstance(port_1, discord.TextChannel) else 'None'}\n"
-                    f"Channel: {port_1.name if isinstance(port_1, discord.TextChannel) else 'None'}\n"
-                    "```"
-                ),
-            )
+            for name, channels in list(self._bridges.items())[:20]:
+                lines = []
+                for channel_id in channels:
+                    port = self.bot.get_channel(channel_id)
+                    if isinstance(port, discord.TextChannel):
+                        lines.append(f"{port.guild.name} #{port.name}")
+                    else:
+                        lines.append(f"Unknown ({channel_id})")
+                emb.add_field(
+                    name=f"Bridge {name}",
+                    value=("```\n" + "\n".join(lines) + "\n```"),
+                )
             emb.add_field(
                 name="Commands",
                 value=(
-                    f"**{ctx.clean_prefix}gateway create**\n> creates a new connection\n\n"
-                    f"**{ctx.clean_prefix}gateway close**\n> closes current connection\n\n"
+                    f"**{ctx.clean_prefix}gateway create [name]**\n> creates a new connection\n\n"
+                    f"**{ctx.clean_prefix}gateway join <name>**\n> adds this channel to a connection\n\n"
+                    f"**{ctx.clean_prefix}gateway close [name]**\n> closes a connection, or all of them\n\n"
                     f"**{ctx.clean_prefix}gateway webhook [enabled|disable]**\n> toggle webhooks\n\n"
+                    f"**{ctx.clean_prefix}gateway batch [enabled|disable]**\n> toggle merging bursts\n\n"
                 ),
                 inline=False,
             )
@@ -91,19 +155,48 @@ class Gateway(commands.Cog):
         """Choose if using wwbhook"""
         if isinstance(decision, bool):
             await self.config.webhook.set(decision)
+            await self.refresh_settings()
             return await ctx.reply(
                 content=f"Using webhooks has been {'enabled' if decision else 'disabled'}.",
                 mention_author=False,
             )
         return await ctx.send(f"Invalid input {decision}")
 
+    @channel_gateway.command(name="batch")
+    async def channel_gateway_batch(self, ctx: commands.Context, decision: bool):
+        """Choose if consecutive messages from the same author are merged"""
+        await self.config.batch.set(decision)
+        await self.refresh_settings()
+        if not decision:
+            for batcher in self._batchers.values():
+                await batcher.flush()
+            self._batchers.clear()
+        return await ctx.reply(
+            content=f"Batching has been {'enabled' if decision else 'disabled'}.",
+            mention_author=False,
+        )
+
+    @channel_gateway.command(name="mirror")
+    async def channel_gateway_mirror(self, ctx: commands.Context, size: int):
+        """Sets how many relayed messages are remembered to mirror edits and deletes"""
+        if not 0 <= size <= 100000:
+            return await ctx.send("Size must be between 0 and 100000.")
+        await self.config.mirror_size.set(size)
+        await self.refresh_settings()
+        return await ctx.reply(
+            content=f"Edits and deletes of the last {size} messages will be mirrored.",
+            mention_author=False,
+        )
+
     @channel_gateway.command(name="create", aliases=["make"])
-    async def channel_gateway_create(self, ctx: commands.Context):
+    async def channel_gateway_create(
+        self, ctx: commands.Context, name: str = "default"
+    ):
         """Starts the process of bridging two channels"""
         react = await ctx.reply(
             content=(
-                "I am about to bridge this channel with a second channel\n"
-                "This will also revert all previous settings\n"
+                f"I am about to bridge this channel with a second channel as `{name}`\n"
+                "This will also revert all previous settings of that bridge\n"
                 "\n"
                 "Are you sure you want to do proceed? type `I agree` to continue"
             ),
@@ -144,8 +237,11 @@ class Gateway(commands.Cog):
             await react.delete()
             return
 
-        await self.config.ports.set((ctx.channel.id, portal.channel.id))
+        await self.config.custom("BRIDGE", name).channels.set(
+            [ctx.channel.id, portal.channel.id]
+        )
         await self.config.enabled.set(True)
+        await self.refresh_settings()
         emb = discord.Embed(
             description=f"Successfully created a gateway between {ctx.channel.name} & {portal.channel.name}",
             color=await ctx.embed_color(),
@@ -154,28 +250,133 @@ class Gateway(commands.Cog):
         await ctx.send(embed=emb)
         await portal.channel.send(embed=emb)
 
+    @channel_gateway.command(name="stats")
+    async def channel_gateway_stats(self, ctx: commands.Context):
+        """Shows relay queue metrics per destination"""
+        if not self._queues:
+            return await ctx.send("Nothing has been relayed yet.")
+        lines = []
+        for channel_id, queue in self._queues.items():
+            channel = self.bot.get_channel(channel_id)
+            lines.append(
+                f"{channel.name if channel is not None else channel_id}: "
+                f"{queue.sent} sent, {queue.pending} pending, {queue.retried} retried, "
+                f"{queue.failed} failed, {queue.dropped} dropped"
+            )
+        emb = discord.Embed(
+            title="Gateway Relays",
+            description=("```\n" + "\n".join(lines)[:4000] + "\n```"),
+            color=await ctx.embed_color(),
+        )
+        return await ctx.reply(embed=emb, mention_author=False)
+
+    @channel_gateway.command(name="join", aliases=["add"])
+    async def channel_gateway_join(self, ctx: commands.Context, name: str):
+        """Adds this channel to an existing bridge"""
+        if name not in self._bridges:
+            return await ctx.send(f"Bridge `{name}` does not exist.")
+        async with self.config.custom("BRIDGE", name).channels() as channels:
+            if ctx.channel.id not in channels:
+                channels.append(ctx.channel.id)
+        await self.refresh_settings()
+        await ctx.message.add_reaction(GREEN_TICK)
+
     @channel_gateway.command(name="shutdown", aliases=["close"])
-    async def channel_gateway_shutdown(self, ctx: commands.Context):
-        await self.config.enabled.set(False)
-        await self.config.ports.set((None, None))
-        await ctx.message.add_reaction(utils.TICK_MRK)
+    async def channel_gateway_shutdown(
+        self, ctx: commands.Context, name: Optional[str] = None
+    ):
+        """Closes a bridge, or every bridge if no name is given"""
+        if name is None:
+            await self.config.enabled.set(False)
+            await self.config.clear_all_custom("BRIDGE")
+        elif name not in self._bridges:
+            return await ctx.send(f"Bridge `{name}` does not exist.")
+        else:
+            await self.config.custom("BRIDGE", name).clear()
+        await self.refresh_settings()
+        await ctx.message.add_reaction(GREEN_TICK)
+
+    async def gateway_webhook(self, channel: discord.TextChannel) -> discord.Webhook:
+        """cached gateway webhook of a channel, fetched or created only once"""
+        if (webhook := pool.cached(channel.id, WEBHOOK_NAME)) is not None:
+            return webhook
+        stored = await self.config.webhooks.get_raw(str(channel.id), default=None)
+        if stored is not None:
+            webhook = discord.Webhook.partial(
+                stored["id"], stored["token"], session=self.session
+            )
+            pool.put(channel.id, WEBHOOK_NAME, webhook)
+        else:
+            webhook = await pool.get(channel, name=WEBHOOK_NAME)
+            await self.config.webhooks.set_raw(
+                str(channel.id), value={"id": webhook.id, "token": webhook.token}
+            )
+        return webhook
+
+    async def forget_webhook(self, channel_id: int) -> None:
+        pool.evict(channel_id, WEBHOOK_NAME)
+        await self.config.webhooks.clear_raw(str(channel_id))
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel: discord.abc.GuildChannel):
+        if pool.cached(channel.id, WEBHOOK_NAME) is not None:
+            await self.forget_webhook(channel.id)
+
+    def relay_queue(self, channel_id: int) -> utils.RelayQueue:
+        """the ordered send queue of a destination, started on first use"""
+        if (queue := self._queues.get(channel_id)) is None:
+            queue = self._queues[channel_id] = utils.RelayQueue(
+                partial(self._relay, channel_id), maxsize=RELAY_BUFFER
+            )
+        return queue
+
+    def batcher(self, channel_id: int) -> utils.MessageBatcher:
+        """the batcher feeding a destination queue, created on first use"""
+        if (batcher := self._batchers.get(channel_id)) is None:
+            batcher = self._batchers[channel_id] = utils.MessageBatcher(
+                self.relay_queue(channel_id).put, window=BATCH_WINDOW
+            )
+        return batcher
+
+    async def _relay(self, channel_id: int, messages: List[discord.Message]):
+        sent = await self._gateway(
+            messages=messages, channel=self.bot.get_channel(channel_id)
+        )
+        if sent is not None:
+            self._relayed.add(
+                utils.RelayRecord(
+                    channel_id=channel_id,
+                    message_id=sent.id,
+                    sources=messages,
+                    embed=None if self._use_webhook else sent.embeds[0],
+                )
+            )
+        return sent
 
-    async def _gateway(self, *, message: discord.Message, channel: discord.TextChannel):
+    async def _gateway(
+        self, *, messages: List[discord.Message], channel: discord.TextChannel
+    ):
+        """relays one or more consecutive messages of the same author as one send"""
         if channel is None:
             return
-        if not await self.config.webhook():
-            embed = discord.Embed(
-                description=message.content, color=message.author.color
-            )
+        message = messages[-1]
+        content = "\n".join(item.content for item in messages if item.content)
+        attachments = [
+            attachment for item in messages for attachment in item.attachments
+        ]
+        limit = channel.guild.filesize_limit
+        files, linked = await self.attachments.prepare(attachments, limit=limit)
+        if not self._use_webhook:
+            embed = discord.Embed(description=content, color=message.author.color)
             embed.set_author(
                 name=f"{message.author} • {message.author.id}",
                 icon_url=message.author.avatar.url,
             )
-            for attachment in message.attachments:
-                if any(
-                    attachment.filename.endswith(extension)
-                    for extension in ["jpg", "png", "gif"]
-                ):
+            for file, kind in files:
+                if kind == "image" and not embed.image:
+                    embed.set_image(url=f"attachment://{file.filename}")
+            for attachment in linked:
+                if utils.classify(attachment) == "image" and not embed.image:
                     embed.set_image(url=attachment.url)
                 else:
                     embed.add_field(
@@ -184,22 +385,13 @@ class Gateway(commands.Cog):
                         inline=False,
                     )
             embed.timestamp = message.created_at
-            return await channel.send(embed=embed)
+            return await channel.send(embed=embed, files=[file for file, _ in files])
         else:
-            if (
-                webhook := discord.utils.get(
-                    await channel.webhooks(), name="qenu.gateway"
-                )
-            ) is None:
-                webhook = await channel.create_webhook(name="qenu.gateway")
             embed = None
-            if message.attachments:
+            if linked:
                 embed = discord.Embed(title="Sent Attachment")
-                for attachment in message.attachments:
-                    if any(
-                        attachment.filename.endswith(extension)
-                        for extension in ["jpg", "png", "gif"]
-                    ):
+                for attachment in linked:
+                    if utils.classify(attachment) == "image" and not embed.image:
                         embed.set_image(url=attachment.url)
                     else:
                         embed.add_field(
@@ -207,26 +399,96 @@ class Gateway(commands.Cog):
                             value=f"[{attachment.filename}]({attachment.url})",
                             inline=False,
                         )
-            await webhook.send(
-                content=message.content,
+            kwargs = dict(
+                content=content,
                 embed=embed,
                 username=message.author.display_name,
                 avatar_url=message.author.avatar.url,
             )
+            try:
+                return await (await self.gateway_webhook(channel)).send(
+                    wait=True, files=[file for file, _ in files], **kwargs
+                )
+            except discord.NotFound:
+                # webhook was deleted, make a new one and retry once
+                await self.forget_webhook(channel.id)
+                files, _ = await self.attachments.prepare(attachments, limit=limit)
+                return await (await self.gateway_webhook(channel)).send(
+                    wait=True, files=[file for file, _ in files], **kwargs
+                )
+
+    async def _mirror_edit(self, record: utils.RelayRecord):
+        channel = self.bot.get_channel(record.channel_id)
+        if channel is None:
+            return
+        with contextlib.suppress(discord.HTTPException):
+            if record.embed is not None:
+                record.embed.description = record.content
+                await channel.get_partial_message(record.message_id).edit(
+                    embed=record.embed
+                )
+            else:
+                await (await self.gateway_webhook(channel)).edit_message(
+                    record.message_id, content=record.content
+                )
+
+    async def _mirror_delete(self, message_id: int):
+        for record in self._relayed.pop(message_id):
+            index = record.sources.index(message_id)
+            del record.sources[index]
+            del record.contents[index]
+            if record.sources:
+                # other messages of the batch remain
+                await self._mirror_edit(record)
+                continue
+            channel = self.bot.get_channel(record.channel_id)
+            if channel is None:
+                continue
+            with contextlib.suppress(discord.HTTPException):
+                if record.embed is not None:
+                    await channel.get_partial_message(record.message_id).delete()
+                else:
+                    await (await self.gateway_webhook(channel)).delete_message(
+                        record.message_id
+                    )
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if payload.message_id not in self._relayed:
+            return
+        if "content" not in payload.data:
+            return
+        for record in self._relayed.get(payload.message_id):
+            index = record.sources.index(payload.message_id)
+            record.contents[index] = payload.data["content"]
+            await self._mirror_edit(record)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.message_id in self._relayed:
+            await self._mirror_delete(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        for message_id in payload.message_ids:
+            if message_id in self._relayed:
+                await self._mirror_delete(message_id)
 
     @commands.Cog.listener()
     async def on_message_without_command(self, message):
+        if (destinations := self._routes.get(message.channel.id)) is None:
+            return
         if message.author.bot:
             return
         if message.guild is None:
             return
-        if not await self.config.enabled():
-            return
         if not await self.bot.allowed_by_whitelist_blacklist(message.author):
             return
-        if message.channel.id in (port := await self.config.ports()):
-            _log.info(f"Gateway message {message.content} from {message.guild.name}")
-            port.remove(message.channel.id)
-            return await self._gateway(
-                message=message, channel=self.bot.get_channel(port[0])
-            )
+        _log.info(f"Gateway message {message.content} from {message.guild.name}")
+        for channel_id in destinations:
+            if self._use_batch:
+                await self.batcher(channel_id).add(message)
+            else:
+                await self.relay_queue(channel_id).put([message])
@@ -1,41 +1,347 @@
 import asyncio
-from typing import Optional
+import io
+import logging
+import mimetypes
+import tempfile
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import discord
-from redbot.core import commands
 
-CROSS_MRK = "<:redTick:901080156217704478>"
-TICK_MRK = "<:greenTick:901080153873068052>"
-GREY_MRK = "<:greyTick:901080154992967691>"
-LOADING = "<:typing:901080160680419419>"
+_log = logging.getLogger("red.qenu.gateway")
 
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024  # larger attachments are buffered on disk
 
-class enutils:
-    async def replying(
+AttachmentKind = Literal["image", "video", "audio", "file"]
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions every `per` seconds, refilled continuously
+    """
+
+    def __init__(self, *, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate, self._tokens + (now - self._updated) * self.rate / self.per
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+
+class RelayQueue:
+    """
+    Ordered sends to one destination
+
+    A single worker drains the buffer, paced by a token bucket,
+    retrying with exponential backoff on 429 and 5xx responses.
+    When the buffer is full, "drop" discards the oldest item,
+    "block" makes put wait for room.
+    """
+
+    def __init__(
         self,
-        ctx: commands.Context,
-        embed: Optional[discord.Embed] = None,
-        content: Optional[str] = None,
-        mention_author: Optional[bool] = False,
-    ):
-        """better reply"""
-        response = await ctx.reply(
-            content=content,
-            embed=embed,
-            mention_author=mention_author,
-        )
+        send: Callable[[Any], Awaitable[Any]],
+        *,
+        maxsize: int = 100,
+        policy: Literal["drop", "block"] = "drop",
+        rate: int = 5,
+        per: float = 5.0,
+        retries: int = 3,
+    ) -> None:
+        self.send = send
+        self.policy = policy
+        self.retries = retries
+        self._bucket = TokenBucket(rate=rate, per=per)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._worker = asyncio.create_task(self._run())
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, item: Any) -> None:
+        if self.policy == "block":
+            return await self._queue.put(item)
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+        self._queue.put_nowait(item)
 
-        await response.add_reaction(CROSS_MRK)
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            finally:
+                self._queue.task_done()
 
-        try:
-            reaction, user = await ctx.bot.wait_for(
-                "reaction_add",
-                timeout=30.0,
-                check=lambda reaction, user: user.id == ctx.author.id
-                and str(reaction.emoji) == CROSS_MRK
-                and reaction.message.id == response.id,
+    async def _deliver(self, item: Any) -> None:
+        for attempt in range(self.retries + 1):
+            await self._bucket.acquire()
+            try:
+                await self.send(item)
+            except discord.HTTPException as e:
+                if (e.status == 429 or e.status >= 500) and attempt < self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                self.failed += 1
+                _log.exception("Relay failed", exc_info=e)
+            except Exception as e:
+                self.failed += 1
+                _log.exception("Relay failed", exc_info=e)
+            else:
+                self.sent += 1
+            return
+
+    def close(self) -> None:
+        self._worker.cancel()
+
+
+class MessageBatcher:
+    """
+    Merges consecutive messages from one author in one channel into a batch
+
+    A batch is flushed when another author or channel comes in, when it would exceed
+    Discord's 2000 characters or 10 attachments, or `window` seconds
+    after its first message.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[discord.Message]], Awaitable[Any]],
+        *,
+        window: float = 1.5,
+        max_chars: int = 2000,
+        max_attachments: int = 10,
+    ) -> None:
+        self._flush = flush
+        self.window = window
+        self.max_chars = max_chars
+        self.max_attachments = max_attachments
+        self._batch: List[discord.Message] = []
+        self._chars = 0
+        self._attachments = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        """create_task, holding a reference until it is done"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _fits(self, message: discord.Message) -> bool:
+        return (
+            message.author.id == self._batch[0].author.id
+            and message.channel.id == self._batch[0].channel.id
+            and self._chars + len(message.content) + 1 <= self.max_chars
+            and self._attachments + len(message.attachments) <= self.max_attachments
+        )
+
+    async def add(self, message: discord.Message) -> None:
+        if self._batch and not self._fits(message):
+            await self.flush()
+        self._batch.append(message)
+        self._chars += len(message.content) + 1
+        self._attachments += len(message.attachments)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, lambda: self._spawn(self.flush())
             )
-        except asyncio.TimeoutError:
-            await response.remove_reaction(CROSS_MRK, ctx.me)
-        else:
-            await response.delete()
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        self._chars = self._attachments = 0
+        if batch:
+            await self._flush(batch)
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class RelayRecord:
+    """
+    One relayed message and the source messages it was made from
+    """
+
+    __slots__ = ("channel_id", "message_id", "sources", "contents", "embed")
+
+    def __init__(
+        self,
+        *,
+        channel_id: int,
+        message_id: int,
+        sources: List[discord.Message],
+        embed: Optional[discord.Embed] = None,
+    ) -> None:
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.sources = [message.id for message in sources]
+        self.contents = [message.content for message in sources]
+        self.embed = embed  # set when relayed as an embed instead of a webhook
+
+    @property
+    def content(self) -> str:
+        return "\n".join(content for content in self.contents if content)
+
+
+class RelayMap:
+    """
+    Bounded LRU of source message id -> records of its relayed copies
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self._maxsize = maxsize
+        self._records: "OrderedDict[int, List[RelayRecord]]" = OrderedDict()
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value: int) -> None:
+        self._maxsize = value
+        self._trim()
+
+    def _trim(self) -> None:
+        while len(self._records) > self._maxsize:
+            self._records.popitem(last=False)
+
+    def add(self, record: RelayRecord) -> None:
+        for message_id in record.sources:
+            self._records.setdefault(message_id, []).append(record)
+            self._records.move_to_end(message_id)
+        self._trim()
+
+    def get(self, message_id: int) -> List[RelayRecord]:
+        return self._records.get(message_id, [])
+
+    def pop(self, message_id: int) -> List[RelayRecord]:
+        return self._records.pop(message_id, [])
+
+
+def classify(attachment: discord.Attachment) -> AttachmentKind:
+    """attachment kind from its content type, falling back to the filename"""
+    content_type = getattr(attachment, "content_type", None)
+    if content_type is None:
+        content_type, _ = mimetypes.guess_type(attachment.filename)
+    major = (content_type or "").split("/")[0]
+    if major in ("image", "video", "audio"):
+        return major
+    return "file"
+
+
+class AttachmentPipeline:
+    """
+    Re-uploads attachments through temporary buffers
+
+    Downloads are streamed in chunks, into memory up to SPOOL_SIZE
+    and into a temporary file beyond that, with at most `concurrency` running.
+    `fetch` yields the bytes of an attachment, it defaults to streaming
+    attachment.url through `session`.
+    """
+
+    def __init__(
+        self,
+        session: Any = None,
+        *,
+        concurrency: int = 4,
+        fetch: Optional[Callable[[discord.Attachment], AsyncIterator[bytes]]] = None,
+    ) -> None:
+        self.session = session
+        self.fetch = fetch or self._stream
+        self._limit = asyncio.Semaphore(concurrency)
+
+    async def _stream(self, attachment: discord.Attachment) -> AsyncIterator[bytes]:
+        async with self.session.get(attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                yield chunk
+
+    async def _spool(self, attachment: discord.Attachment) -> discord.File:
+        async with self._limit:
+            # discord.File needs an io.IOBase, which SpooledTemporaryFile
+            # only is from python 3.11 on, so pick the buffer up front
+            if attachment.size <= SPOOL_SIZE:
+                buffer = io.BytesIO()
+            else:
+                buffer = tempfile.TemporaryFile()
+            try:
+                async for chunk in self.fetch(attachment):
+                    buffer.write(chunk)
+            except BaseException:
+                buffer.close()
+                raise
+            buffer.seek(0)
+            return discord.File(buffer, filename=attachment.filename)
+
+    async def prepare(
+        self, attachments: List[discord.Attachment], *, limit: int
+    ) -> Tuple[List[Tuple[discord.File, AttachmentKind]], List[discord.Attachment]]:
+        """
+        spools the attachments fitting in `limit` bytes in total,
+        returns them as files with their kind, and the rest to be linked
+        """
+        uploads, linked = [], []
+        budget = limit
+        for attachment in attachments:
+            if attachment.size <= budget:
+                uploads.append(attachment)
+                budget -= attachment.size
+            else:
+                linked.append(attachment)
+
+        results = await asyncio.gather(
+            *(self._spool(attachment) for attachment in uploads),
+            return_exceptions=True,
+        )
+        files = []
+        for attachment, result in zip(uploads, results):
+            if isinstance(result, BaseException):
+                _log.warning(f"Could not re-upload {attachment.filename}: {result}")
+                linked.append(attachment)
+            else:
+                files.append((result, classify(attachment)))
+        return files, linked
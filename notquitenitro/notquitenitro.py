@@ -1,11 +1,22 @@
-from typing import Literal, Optional
+import asyncio
+import re
+from typing import Literal, Set
 
 import discord
 from redbot.core import commands
 from redbot.core.bot import Red
 from redbot.core.config import Config
 
+try:
+    from cog_shared.qenucore import pool
+except ImportError:
+    from qenucore import pool
+
+from .utils import EmojiIndex
+
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
+# formatted emojis are matched as well so they are left untouched
+EMOJI_TOKEN = re.compile(r"<a?:\w+:\d+>|:(\w{2,32}):")
 
 
 class Notquitenitro(commands.Cog):
@@ -25,33 +36,142 @@ class Notquitenitro(commands.Cog):
 
         self.config.register_guild(**default_guild)
 
+        self.emojis = EmojiIndex()
+        self._enabled: Set[int] = set()  # guild ids with inline nqn on
+        self._index_task = asyncio.create_task(self.build_index())
+
+    def cog_unload(self):
+        self._index_task.cancel()
+
+    async def build_index(self) -> None:
+        await self.bot.wait_until_red_ready()
+        for guild in self.bot.guilds:
+            self.emojis.set_guild(guild.id, guild.emojis)
+        self._enabled = {
+            guild_id
+            for guild_id, data in (await self.config.all_guilds()).items()
+            if data["nqn"]
+        }
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild: discord.Guild, before, after):
+        self.emojis.set_guild(guild.id, after)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.emojis.set_guild(guild.id, guild.emojis)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.emojis.remove_guild(guild.id)
+
     async def red_delete_data_for_user(
         self, *, requester: RequestType, user_id: int
     ) -> None:
         # TODO: Replace this with the proper end user data removal handling.
         super().red_delete_data_for_user(requester=requester, user_id=user_id)
 
-    async def nqn_webhook(
-        self, channel: discord.TextChannel
-    ) -> Optional[discord.Webhook]:
-        return discord.utils.get(await channel.webhooks(), name="nqn")
+    async def nqn_webhook(self, channel: discord.TextChannel) -> discord.Webhook:
+        return await pool.get(channel, name="nqn")
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel: discord.abc.GuildChannel):
+        pool.evict(channel.id, "nqn")
 
     @commands.command(name="nqn")
     @commands.guild_only()
     @commands.bot_has_permissions(manage_webhooks=True, manage_messages=True)
     async def nqn(self, ctx: commands.Context, emoji_name: str):
-        """nqn emote from this guild"""
+        """nqn emote, from this guild first, then any guild i am in"""
         pseudo = ctx.author
 
-        emoji = discord.utils.get(ctx.guild.emojis, name=emoji_name)
+        emoji = self.emojis.get(emoji_name, guild_id=ctx.guild.id)
         if emoji is None:
-            await ctx.send(f'Emoji "{emoji_name}" not found.')
+            suggestions = self.emojis.fuzzy(emoji_name)
+            await ctx.send(
+                f'Emoji "{emoji_name}" not found.'
+                + (f" Did you mean `{'`, `'.join(suggestions)}`?" if suggestions else "")
+            )
             return
+        if not isinstance(ctx.channel, discord.TextChannel):
+            return await ctx.send("Webhooks are not available in this channel.")
 
-        if (webhook := await self.nqn_webhook(ctx.channel)) is None:
-            webhook = await ctx.channel.create_webhook(name="nqn")
-
-        await webhook.send(
-            content=emoji, username=pseudo.display_name, avatar_url=pseudo.avatar_url
+        await pool.send(
+            ctx.channel,
+            name="nqn",
+            content=emoji,
+            username=pseudo.display_name,
+            avatar_url=pseudo.display_avatar.url,
         )
         await ctx.message.delete()
+
+    @commands.command(name="nqnsearch")
+    @commands.guild_only()
+    async def nqn_search(self, ctx: commands.Context, query: str):
+        """search emote names usable with nqn"""
+        names = self.emojis.prefix(query) or self.emojis.fuzzy(query)
+        if not names:
+            return await ctx.send(f'No emoji matching "{query}".')
+        await ctx.send(
+            embed=discord.Embed(
+                description=" ".join(f"`{name}`" for name in names),
+                color=await ctx.embed_color(),
+            )
+        )
+
+    @commands.command(name="nqnset")
+    @commands.guild_only()
+    @commands.admin_or_permissions(manage_guild=True)
+    async def nqn_set(self, ctx: commands.Context, on_off: bool):
+        """toggle rewriting :emoji: in every message of this guild"""
+        await self.config.guild(ctx.guild).nqn.set(on_off)
+        if on_off:
+            self._enabled.add(ctx.guild.id)
+        else:
+            self._enabled.discard(ctx.guild.id)
+        await ctx.send(
+            f"Inline nqn has been {'enabled' if on_off else 'disabled'} in this guild."
+        )
+
+    def rewrite(self, content: str, *, guild_id: int) -> str:
+        """replaces resolvable :name: tokens, returns content unchanged if none"""
+
+        def replace(match: re.Match) -> str:
+            if match.group(1) is None:
+                return match.group(0)
+            emoji = self.emojis.get(match.group(1), guild_id=guild_id)
+            return match.group(0) if emoji is None else str(emoji)
+
+        return EMOJI_TOKEN.sub(replace, content)
+
+    @commands.Cog.listener()
+    async def on_message_without_command(self, message: discord.Message):
+        if ":" not in message.content:
+            return
+        if message.guild is None or message.guild.id not in self._enabled:
+            return
+        if message.author.bot or message.webhook_id is not None:
+            return
+        # the webhook repost cannot carry these over
+        if message.attachments or message.stickers or message.reference is not None:
+            return
+        if not isinstance(message.channel, discord.TextChannel):
+            return
+        rewritten = self.rewrite(message.content, guild_id=message.guild.id)
+        if rewritten == message.content or len(rewritten) > 2000:
+            return
+        permissions = message.channel.permissions_for(message.guild.me)
+        if not (permissions.manage_webhooks and permissions.manage_messages):
+            return
+        if not await self.bot.allowed_by_whitelist_blacklist(message.author):
+            return
+
+        await pool.send(
+            message.channel,
+            name="nqn",
+            content=rewritten,
+            username=message.author.display_name,
+            avatar_url=message.author.display_avatar.url,
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+        await message.delete()
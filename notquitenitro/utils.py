@@ -0,0 +1,79 @@
+import bisect
+import difflib
+from typing import Dict, Iterable, List, Optional
+
+import discord
+
+
+class EmojiIndex:
+    """
+    Bot-wide emoji lookup by case-insensitive name
+
+    Names are kept in a sorted list for prefix search,
+    and entries are replaced per guild on every update.
+    """
+
+    def __init__(self) -> None:
+        self._by_name: Dict[str, List[discord.Emoji]] = {}
+        self._by_guild: Dict[int, List[discord.Emoji]] = {}
+        self._names: List[str] = []  # sorted keys of _by_name
+
+    def __len__(self) -> int:
+        return sum(len(emojis) for emojis in self._by_guild.values())
+
+    def _add(self, emoji: discord.Emoji) -> None:
+        key = emoji.name.lower()
+        if key not in self._by_name:
+            self._by_name[key] = []
+            bisect.insort(self._names, key)
+        self._by_name[key].append(emoji)
+
+    def _discard(self, emoji: discord.Emoji) -> None:
+        key = emoji.name.lower()
+        entries = self._by_name.get(key, [])
+        entries[:] = [entry for entry in entries if entry.id != emoji.id]
+        if not entries and key in self._by_name:
+            del self._by_name[key]
+            del self._names[bisect.bisect_left(self._names, key)]
+
+    def set_guild(self, guild_id: int, emojis: Iterable[discord.Emoji]) -> None:
+        """replaces every emoji indexed for a guild"""
+        self.remove_guild(guild_id)
+        emojis = [emoji for emoji in emojis if emoji.available]
+        self._by_guild[guild_id] = emojis
+        for emoji in emojis:
+            self._add(emoji)
+
+    def remove_guild(self, guild_id: int) -> None:
+        for emoji in self._by_guild.pop(guild_id, []):
+            self._discard(emoji)
+
+    def get(
+        self, name: str, *, guild_id: Optional[int] = None
+    ) -> Optional[discord.Emoji]:
+        """
+        emoji by name, preferring an exact case match,
+        then one from guild_id, then any other guild
+        """
+        entries = self._by_name.get(name.lower())
+        if not entries:
+            return None
+        return min(
+            entries,
+            key=lambda emoji: (emoji.name != name, emoji.guild_id != guild_id),
+        )
+
+    def prefix(self, prefix: str, *, limit: int = 25) -> List[str]:
+        """indexed names starting with prefix, in sorted order"""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._names, prefix)
+        matches = []
+        for key in self._names[start : start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append(key)
+        return matches
+
+    def fuzzy(self, name: str, *, limit: int = 5) -> List[str]:
+        """indexed names close to name"""
+        return difflib.get_close_matches(name.lower(), self._names, n=limit)
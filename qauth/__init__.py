@@ -10,4 +10,6 @@ with open(Path(__file__).parent / "info.json") as fp:
 
 
 async def setup(bot: Red) -> None:
-    bot.add_cog(Qauth(bot))
+    cog = Qauth(bot)
+    await cog.initialize()
+    bot.add_cog(cog)
@@ -1,7 +1,8 @@
 import asyncio
+import contextlib
 import math
 import time
-from typing import Literal, Optional
+from typing import Dict, Literal, Optional, Tuple
 
 import discord
 import pyotp
@@ -12,7 +13,14 @@ from redbot.core.config import Config
 from redbot.core.utils.chat_formatting import pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
+from .totp import TOTPVerifier
+from .utils import HAS_MODALS, OTPChallenge, SessionManager
+
+if HAS_MODALS:
+    from .utils import OTPView
+
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
+SECRET_TTL = 60  # seconds a fetched secret is kept in memory
 
 
 class Qauth(commands.Cog):
@@ -29,41 +37,118 @@ class Qauth(commands.Cog):
         )
 
         default_user = {"secret": ""}
-        default_guild = {"allowed": [], "timeout": 300, "role_id": 0}
-        default_global = {"_qauth": {}}
+        default_guild = {"allowed": [], "timeout": 300, "role_id": 0, "active": {}}
+        default_global = {
+            "_qauth": {},  # legacy, migrated into guild "active"
+            "valid_window": 1,  # accepted clock drift in 30s steps
+        }
 
         self.config.register_user(**default_user)
         self.config.register_guild(**default_guild)
         self.config.register_global(**default_global)
 
+        # guild id -> {member id: timeout}, mirrors guild "active"
+        self._active: Dict[int, Dict[int, int]] = {}
+        # guild id -> {"allowed": set, "role_id": int, "timeout": int}
+        self._settings: Dict[int, dict] = {}
+        # user id -> (secret, expiry in monotonic time)
+        self._secrets: Dict[int, Tuple[str, float]] = {}
+        self.verifier = TOTPVerifier(ttl=SECRET_TTL)
+        self.sessions = SessionManager()
+
         self.role_check.start()
 
+    async def initialize(self) -> None:
+        """loads active grants into memory, migrating the old global store"""
+        legacy = await self.config._qauth()
+        for guild_id, grants in legacy.items():
+            async with self.config.guild_from_id(int(guild_id)).active() as active:
+                active.update(grants)
+        if legacy:
+            await self.config._qauth.clear()
+
+        self.verifier.valid_window = await self.config.valid_window()
+
+        for guild_id, data in (await self.config.all_guilds()).items():
+            if data["active"]:
+                self._active[guild_id] = {
+                    int(user_id): timeout
+                    for user_id, timeout in data["active"].items()
+                }
+
+    def cog_unload(self):
+        self.role_check.cancel()
+
     async def red_delete_data_for_user(
         self, *, requester: RequestType, user_id: int
     ) -> None:
         # TODO: Replace this with the proper end user datapip removal handling.
         super().red_delete_data_for_user(requester=requester, user_id=user_id)
 
-    async def auth_add(self, *, user: discord.User, guild: discord.Guild, time: int):
-        async with self.config._qauth() as auth:
-            _guild = auth.get(str(guild.id), None)
-            if isinstance(_guild, type(None)):
-                # create if not exist
-                auth[str(guild.id)] = {}
-            auth[str(guild.id)][str(user.id)] = time
+    async def guild_settings(self, guild: discord.Guild) -> dict:
+        """cached guild settings, with the allow list as a set"""
+        settings = self._settings.get(guild.id)
+        if settings is None:
+            data = await self.config.guild(guild).all()
+            settings = {
+                "allowed": set(data["allowed"]),
+                "role_id": data["role_id"],
+                "timeout": data["timeout"],
+            }
+            self._settings[guild.id] = settings
+        return settings
+
+    def invalidate_guild(self, guild: discord.Guild) -> None:
+        self._settings.pop(guild.id, None)
+
+    async def get_secret(self, user: discord.abc.User) -> str:
+        """user secret, kept in memory for at most SECRET_TTL seconds"""
+        cached = self._secrets.get(user.id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        secret = await self.config.user(user).secret()
+        if secret != "":
+            self._secrets[user.id] = (secret, time.monotonic() + SECRET_TTL)
+        return secret
+
+    def invalidate_secret(self, user: discord.abc.User) -> None:
+        self._secrets.pop(user.id, None)
+        self.verifier.discard(user.id)
+
+    def purge_secrets(self) -> None:
+        """drops cached secrets and TOTPs whose SECRET_TTL has passed"""
+        now = time.monotonic()
+        expired = [
+            user_id for user_id, (_, expiry) in self._secrets.items() if expiry <= now
+        ]
+        for user_id in expired:
+            del self._secrets[user_id]
+        self.verifier.purge(now)
+
+    def is_active(self, *, user_id: int, guild_id: int) -> bool:
+        """returns True if the member currently holds the role"""
+        return user_id in self._active.get(guild_id, {})
+
+    async def auth_add(self, *, user_id: int, guild_id: int, time: int):
+        self._active.setdefault(guild_id, {})[user_id] = time
+        await self.config.guild_from_id(guild_id).active.set_raw(
+            str(user_id), value=time
+        )
 
-    async def auth_remove(self, *, user: discord.User, guild: discord.Guild):
-        async with self.config._qauth() as auth:
-            del auth[str(guild.id)][str(user.id)]
-            if len(auth[str(guild.id)]) == 0:
-                del auth[str(guild.id)]
+    async def auth_remove(self, *, user_id: int, guild_id: int):
+        grants = self._active.get(guild_id, {})
+        grants.pop(user_id, None)
+        if len(grants) == 0:
+            self._active.pop(guild_id, None)
+        await self.config.guild_from_id(guild_id).active.clear_raw(str(user_id))
 
     @commands.command(name="qauthorize", aliases=["qa", "su"])
     @commands.guild_only()
     async def qauthorize(self, ctx: commands.Context):
         """toggle priviledges"""
         member = ctx.author
-        role_id = await self.config.guild(ctx.guild).role_id()
+        settings = await self.guild_settings(ctx.guild)
+        role_id = settings["role_id"]
         if role_id == 0:
             return await ctx.reply(
                 content=(
@@ -82,28 +167,73 @@ class Qauth(commands.Cog):
                 ),
                 mention_author=False,
             )
-        if member.id not in await self.config.guild(ctx.guild).allowed():
+        if member.id not in settings["allowed"]:
             return await ctx.reply(
                 content="You do not have permission to do that.",
                 mention_author=False,
             )
 
-        auth = await self.config._qauth()
-        if (not isinstance(auth.get(str(ctx.guild.id), None), type(None))) and str(
-            member.id
-        ) in auth[str(ctx.guild.id)]:
+        if self.is_active(user_id=member.id, guild_id=ctx.guild.id):
             # disable
             await member.remove_roles(role, reason="qauth role remove on demand")
-            await self.auth_remove(user=member, guild=ctx.guild)
+            await self.auth_remove(user_id=member.id, guild_id=ctx.guild.id)
             return await ctx.reply(
                 content="Your role has been removed.", mention_author=False
             )
 
-        if await self.config.user(ctx.author).secret() == "":
+        if (secret := await self.get_secret(ctx.author)) == "":
             return await ctx.reply(
                 content="An error must've occured, you haven't been registered yet.",
                 mention_author=False,
             )
+
+        if HAS_MODALS:
+            guild_message, result = await self.interaction_challenge(
+                ctx, secret=secret
+            )
+        else:
+            guild_message, result = await self.dm_challenge(ctx)
+        if result is None:
+            return
+
+        if result:
+            # enable
+            await member.add_roles(role, reason="qauth role verified")
+            timeout = settings["timeout"]
+            timeout = int(time.time() + timeout) if timeout != -1 else timeout
+            await self.auth_add(user_id=member.id, guild_id=ctx.guild.id, time=timeout)
+            return await guild_message.edit(content="Auth Verified.")
+
+        else:
+            return await guild_message.edit(content="Auth failed.")
+
+    async def interaction_challenge(
+        self, ctx: commands.Context, *, secret: str, attempt: int = 3
+    ) -> Tuple[discord.Message, bool]:
+        """asks for the code through a button and modal on the request itself"""
+        challenge = OTPChallenge(
+            user_id=ctx.author.id,
+            verify=lambda code: self.timebasedOTP(
+                secret=secret, code=code, user_id=ctx.author.id
+            ),
+            attempts=attempt,
+        )
+        view = OTPView(challenge, timeout=60.0)
+        guild_message = await ctx.reply(
+            content="I have received your request, press the button to enter your code.",
+            view=view,
+            mention_author=False,
+        )
+        result = await challenge.wait(timeout=60.0)
+        view.stop()
+        await guild_message.edit(view=None)
+        return guild_message, result
+
+    async def dm_challenge(
+        self, ctx: commands.Context
+    ) -> Tuple[discord.Message, Optional[bool]]:
+        """asks for the code in dms, used when interactions are unavailable"""
+        member = ctx.author
         guild_message = await ctx.reply(
             content="I have received your request, please check your dms.",
             mention_author=False,
@@ -111,6 +241,11 @@ class Qauth(commands.Cog):
         author_dm = member.dm_channel
         if isinstance(author_dm, type(None)):
             author_dm = await member.create_dm()
+        if author_dm.id in self.sessions:
+            await guild_message.edit(
+                content="You already have a pending request, please finish it first."
+            )
+            return guild_message, None
 
         otpinfo = discord.Embed(
             description=(
@@ -134,37 +269,26 @@ class Qauth(commands.Cog):
         await author_dm.send(embed=otpinfo)
 
         result = await self.validate_attempts(user=member._user, user_dm=author_dm)
-
-        if result:
-            # enable
-            await member.add_roles(role, reason="qauth role verified")
-            timeout = await self.config.guild(ctx.guild).timeout()
-            timeout = int(time.time() + timeout) if timeout != -1 else timeout
-            await self.auth_add(user=member, guild=ctx.guild, time=timeout)
-            return await guild_message.edit(
-                content="Auth Verified.", mention_author=False
-            )
-
-        else:
-            return await guild_message.edit(
-                content="Auth failed.", mention_author=False
-            )
+        return guild_message, result
 
     async def validate_attempts(
         self, *, user: discord.user, user_dm: discord.TextChannel, attempt: int = 3
     ) -> bool:
-        secret = await self.config.user(user).secret()
-        while attempt > 0:
-
-            def validate(message):
-                return len(message.content) == 6 and message.channel == user_dm
-
-            try:
-                code = await self.bot.wait_for("message", check=validate, timeout=60.0)
-            except asyncio.TimeoutError:
-                return await user_dm.send(content="Request timeout.")
-            else:
-                if self.timebasedOTP(secret=secret, code=code.content):
+        secret = await self.get_secret(user)
+        with self.sessions.open(
+            user_id=user.id, channel_id=user_dm.id, timeout=60.0, attempts=attempt
+        ) as session:
+            while session.attempts > 0:
+                try:
+                    code = await session.next_message()
+                except asyncio.TimeoutError:
+                    await user_dm.send(content="Request timeout.")
+                    return False
+                if len(code.content) != 6:
+                    continue
+                if self.timebasedOTP(
+                    secret=secret, code=code.content, user_id=user.id
+                ):
                     await user_dm.send(
                         embed=discord.Embed(
                             description="Code verified.", color=discord.Color.green()
@@ -172,10 +296,10 @@ class Qauth(commands.Cog):
                     )
                     return True
                 else:
-                    attempt -= 1
+                    session.attempts -= 1
                     await user_dm.send(
                         embed=discord.Embed(
-                            description=f"Wrong code. please try again...\n {attempt}/3 remaining attempts.",
+                            description=f"Wrong code. please try again...\n {session.attempts}/{attempt} remaining attempts.",
                             color=discord.Color.red(),
                         )
                     )
@@ -190,15 +314,23 @@ class Qauth(commands.Cog):
     def create_secret(self) -> str:
         return pyotp.random_base32()
 
-    def timebasedOTP(self, *, secret: str, code: str) -> bool:
-        """returns True if OTP code valid"""
-        return pyotp.TOTP(secret).verify(code)
+    def timebasedOTP(
+        self, *, secret: str, code: str, user_id: Optional[int] = None
+    ) -> bool:
+        """
+        returns True if OTP code valid
+        codes checked with a user_id can not be replayed
+        """
+        if user_id is None:
+            return pyotp.TOTP(secret).verify(code)
+        return self.verifier.verify(user_id=user_id, secret=secret, code=code)
 
     @commands.command()
     @commands.is_owner()
     async def resetotp(self, ctx: Optional[commands.Context], *, user: discord.User):
         """removes user secret"""
         await self.config.user(user).secret.set("")
+        self.invalidate_secret(user)
         await user.send(
             content=f"Your Auth Key has been reseted, you can now re-register for a new key."
         )
@@ -285,16 +417,22 @@ class Qauth(commands.Cog):
             )
         )
 
-        def check_agree(message):
-            return message.content.lower() == "agree" and message.channel == ctx.channel
-
-        try:
-            await self.bot.wait_for("message", check=check_agree, timeout=180.0)
-        except asyncio.TimeoutError:
+        if ctx.channel.id in self.sessions:
             return await ctx.send(
-                content="Request Timed out, please do `[p]qauth register` again once you're ready!"
+                content="You already have a pending request, please finish it first."
             )
 
+        with self.sessions.open(
+            user_id=ctx.author.id, channel_id=ctx.channel.id, timeout=180.0
+        ) as session:
+            try:
+                while (await session.next_message()).content.lower() != "agree":
+                    pass
+            except asyncio.TimeoutError:
+                return await ctx.send(
+                    content="Request Timed out, please do `[p]qauth register` again once you're ready!"
+                )
+
         secret = self.create_secret()
         with_code = await ctx.send(
             embed=discord.Embed(
@@ -308,12 +446,20 @@ class Qauth(commands.Cog):
             )
         )
 
-        def verify(message):
-            return self.timebasedOTP(secret=secret, code=message.content)
+        with self.sessions.open(
+            user_id=ctx.author.id, channel_id=ctx.channel.id, timeout=60.0
+        ) as session:
+            try:
+                while not self.timebasedOTP(
+                    secret=secret, code=(await session.next_message()).content
+                ):
+                    pass
+            except asyncio.TimeoutError:
+                verified = False
+            else:
+                verified = True
 
-        try:
-            await self.bot.wait_for("message", check=verify, timeout=60.0)
-        except asyncio.TimeoutError:
+        if not verified:
             await with_code.delete()
             return await ctx.send(
                 content="Request Timed out, please do `[p]qauth register` again once you're ready!"
@@ -321,11 +467,13 @@ class Qauth(commands.Cog):
         else:
             await with_code.delete()
             await self.config.user(ctx.author).secret.set(secret)
+            self.invalidate_secret(ctx.author)
             await ctx.send("Your qauth has been successfully registered!")
 
     async def _set_role(self, *, guild: discord.Guild, role_id: int) -> None:
         """sets the role with config"""
-        return await self.config.guild(guild).role_id.set(role_id)
+        await self.config.guild(guild).role_id.set(role_id)
+        self.invalidate_guild(guild)
 
     @qauth.command(name="role")
     @commands.has_permissions(administrator=True)
@@ -334,6 +482,22 @@ class Qauth(commands.Cog):
         await self._set_role(guild=ctx.guild, role_id=role.id)
         return await ctx.tick()
 
+    @qauth.command(name="window")
+    @commands.is_owner()
+    async def set_window(self, ctx: commands.Context, steps: int):
+        """
+        set how many 30 second steps of clock drift are accepted
+        default is 1, must be between 0 and 10
+        """
+        if not 0 <= steps <= 10:
+            return await ctx.reply(
+                content="Window must be between 0 and 10 steps.",
+                mention_author=False,
+            )
+        await self.config.valid_window.set(steps)
+        self.verifier.valid_window = steps
+        return await ctx.tick()
+
     @qauth.command(name="timeout")
     @commands.has_permissions(administrator=True)
     async def set_timeout(self, ctx: commands.Context, seconds: int):
@@ -347,6 +511,7 @@ class Qauth(commands.Cog):
                 mention_author=False,
             )
         await self.config.guild(ctx.guild).timeout.set(seconds)
+        self.invalidate_guild(ctx.guild)
         return await ctx.reply(
             content=f"The timeout for {ctx.guild.name} has been set to {seconds} seconds.",
             mention_author=False,
@@ -363,6 +528,7 @@ class Qauth(commands.Cog):
                     mention_author=False,
                 )
             guild["allowed"].append(user.id)
+        self.invalidate_guild(ctx.guild)
         reply = f"I have added {user}({user.id}) to qauth list"
         secret = await self.config.user(user).secret()
         if secret == "":
@@ -398,6 +564,7 @@ class Qauth(commands.Cog):
                     mention_author=False,
                 )
             guild["allowed"].remove(user.id)
+        self.invalidate_guild(ctx.guild)
         return await ctx.reply(
             content=f"I have removed {user}({user.id}) from qauth list",
             mention_author=False,
@@ -409,11 +576,11 @@ class Qauth(commands.Cog):
         allowed = await self.config.guild(ctx.guild).allowed()
 
         message = ""
-        auth = await self.config._qauth()
-        if isinstance(auth.get(str(ctx.guild.id)), type(None)):
+        active = self._active.get(ctx.guild.id)
+        if isinstance(active, type(None)):
             return await ctx.reply(content="empty list", mention_author=False)
         for member_id in allowed:
-            message += f"{'+' if str(member_id) in auth[str(ctx.guild.id)] else '-'} {ctx.guild.get_member(member_id)}\n"
+            message += f"{'+' if member_id in active else '-'} {ctx.guild.get_member(member_id)}\n"
 
         embeds = []
         pages = 1
@@ -429,44 +596,61 @@ class Qauth(commands.Cog):
 
         await menu(ctx, embeds, DEFAULT_CONTROLS)
 
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        self.sessions.dispatch(message)
+
     @tasks.loop(seconds=10)
     async def role_check(self):
+        self.purge_secrets()
         now = time.time()
-        async with self.config._qauth() as auth:
-            for guild in auth:
-                role = await self.config.guild(guild).role_id()
-                removal = []
-                for user in auth[guild]:
-                    if (timeout := auth[guild][user]) != -1 and timeout <= now:
-                        removal.append(user)
-                for user in removal:
-                    await self.bot.get_or_fetch_member(
-                        guild=guild, member_id=user
-                    ).remove_roles(
-                        await self.bot.get_guild(guild).get_role(role),
-                        reason="qauth role remove on timeout",
-                    )
-                    del auth[user]
+        for guild_id, grants in list(self._active.items()):
+            removal = [
+                user_id
+                for user_id, timeout in grants.items()
+                if timeout != -1 and timeout <= now
+            ]
+            if not removal:
+                continue
+            guild = self.bot.get_guild(guild_id)
+            role = None
+            if guild is not None:
+                role = guild.get_role((await self.guild_settings(guild))["role_id"])
+            for user_id in removal:
+                member = guild.get_member(user_id) if guild is not None else None
+                if member is not None and role is not None:
+                    with contextlib.suppress(discord.HTTPException):
+                        await member.remove_roles(
+                            role, reason="qauth role remove on timeout"
+                        )
+                await self.auth_remove(user_id=user_id, guild_id=guild_id)
+
+    @role_check.before_loop
+    async def before_role_check(self):
+        await self.bot.wait_until_red_ready()
 
     @qauth.command(name="test")
     async def test(self, ctx: commands.Context):
-        secret = await self.config.user(ctx.author).secret()
+        secret = await self.get_secret(ctx.author)
+        if ctx.channel.id in self.sessions:
+            return await ctx.reply(
+                content="There is already a pending request in this channel.",
+                mention_author=False,
+            )
 
         await ctx.send(content="Please enter your OTP code.")
 
-        def verify(message):
-            return (
-                len(message.content) == 6
-                and message.author == ctx.author
-                and message.channel == ctx.channel
-            )
+        with self.sessions.open(
+            user_id=ctx.author.id, channel_id=ctx.channel.id, timeout=60.0
+        ) as session:
+            try:
+                code = await session.next_message()
+                while len(code.content) != 6:
+                    code = await session.next_message()
+            except asyncio.TimeoutError:
+                return await ctx.reply(content="Request Timed out", mention_author=False)
 
-        try:
-            code = await self.bot.wait_for("message", check=verify, timeout=60.0)
-        except asyncio.TimeoutError:
-            return await ctx.reply(content="Request Timed out", mention_author=False)
+        if self.timebasedOTP(secret=secret, code=code.content, user_id=ctx.author.id):
+            return await ctx.reply("OTP verified!", mention_author=False)
         else:
-            if self.timebasedOTP(secret=secret, code=code.content):
-                return await ctx.reply("OTP verified!", mention_author=False)
-            else:
-                return await ctx.reply("Invalid OTP.", mention_author=False)
+            return await ctx.reply("Invalid OTP.", mention_author=False)
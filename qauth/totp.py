@@ -0,0 +1,76 @@
+import hashlib
+import hmac
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import pyotp
+
+
+class TOTPVerifier:
+    """
+    TOTP verification with replay protection, keyed by user id
+
+    pyotp.TOTP objects hold the secret, so they are only kept for `ttl`
+    seconds, like the secrets themselves. The last accepted time-step is
+    kept longer in a bounded LRU, tagged with a hash of the secret, so a
+    code can only be used once within its window.
+    """
+
+    def __init__(
+        self, *, maxsize: int = 1024, valid_window: int = 1, ttl: float = 60.0
+    ) -> None:
+        self.maxsize = maxsize
+        self.valid_window = valid_window
+        self.ttl = ttl
+        # user id -> (secret digest, TOTP, expiry), oldest expiry first
+        self._totps: "OrderedDict[int, Tuple[bytes, pyotp.TOTP, float]]" = OrderedDict()
+        # user id -> (secret digest, last accepted time-step)
+        self._steps: "OrderedDict[int, Tuple[bytes, int]]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        while self._totps and next(iter(self._totps.values()))[2] <= now:
+            self._totps.popitem(last=False)
+
+    def _totp(self, user_id: int, secret: str, digest: bytes) -> pyotp.TOTP:
+        now = time.monotonic()
+        self._expire(now)
+        cached = self._totps.get(user_id)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        totp = pyotp.TOTP(secret)
+        self._totps[user_id] = (digest, totp, now + self.ttl)
+        self._totps.move_to_end(user_id)
+        return totp
+
+    def verify(
+        self, *, user_id: int, secret: str, code: str, now: Optional[float] = None
+    ) -> bool:
+        """returns True if code is valid and has not been used before"""
+        if len(code) != 6 or not code.isdigit():
+            return False
+        digest = hashlib.sha256(secret.encode("utf-8")).digest()
+        totp = self._totp(user_id, secret, digest)
+        last = self._steps.get(user_id)
+        last_step = last[1] if last is not None and last[0] == digest else -1
+        current = int(time.time() if now is None else now) // totp.interval
+        for step in range(
+            current - self.valid_window, current + self.valid_window + 1
+        ):
+            if step <= last_step:
+                continue
+            if hmac.compare_digest(totp.generate_otp(step), code):
+                self._steps[user_id] = (digest, step)
+                self._steps.move_to_end(user_id)
+                if len(self._steps) > self.maxsize:
+                    self._steps.popitem(last=False)
+                return True
+        return False
+
+    def purge(self, now: Optional[float] = None) -> None:
+        """drops the TOTP objects whose ttl has passed"""
+        self._expire(time.monotonic() if now is None else now)
+
+    def discard(self, user_id: int) -> None:
+        self._totps.pop(user_id, None)
+        self._steps.pop(user_id, None)
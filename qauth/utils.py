@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+from typing import Callable, Dict, Iterator
+
+import discord
+
+# modals need discord.py 2.0, older versions fall back to dms
+HAS_MODALS = hasattr(discord, "ui") and hasattr(discord.ui, "Modal")
+
+
+class ChallengeSession:
+    """
+    A pending challenge waiting for messages from one user in one channel
+    """
+
+    def __init__(
+        self, *, user_id: int, channel_id: int, timeout: float, attempts: int
+    ) -> None:
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.attempts = attempts
+        self.deadline = asyncio.get_running_loop().time() + timeout
+        self._queue: "asyncio.Queue[discord.Message]" = asyncio.Queue()
+
+    def feed(self, message: discord.Message) -> None:
+        self._queue.put_nowait(message)
+
+    async def next_message(self) -> discord.Message:
+        """waits for the next message, raises asyncio.TimeoutError past deadline"""
+        remaining = self.deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        return await asyncio.wait_for(self._queue.get(), timeout=remaining)
+
+
+class SessionManager:
+    """
+    Pending challenges keyed by channel id,
+    fed by a single message listener
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[int, ChallengeSession] = {}
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._sessions
+
+    @contextlib.contextmanager
+    def open(
+        self,
+        *,
+        user_id: int,
+        channel_id: int,
+        timeout: float = 60.0,
+        attempts: int = 3,
+    ) -> Iterator[ChallengeSession]:
+        session = ChallengeSession(
+            user_id=user_id, channel_id=channel_id, timeout=timeout, attempts=attempts
+        )
+        self._sessions[channel_id] = session
+        try:
+            yield session
+        finally:
+            if self._sessions.get(channel_id) is session:
+                del self._sessions[channel_id]
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """routes a message to its session, returns True if consumed"""
+        session = self._sessions.get(message.channel.id)
+        if session is None or message.author.id != session.user_id:
+            return False
+        session.feed(message)
+        return True
+
+
+class OTPChallenge:
+    """
+    Verification state of one interaction based request,
+    shared by its button and modal
+    """
+
+    def __init__(
+        self, *, user_id: int, verify: Callable[[str], bool], attempts: int = 3
+    ) -> None:
+        self.user_id = user_id
+        self.verify = verify
+        self.attempts = attempts
+        self._result: "asyncio.Future[bool]" = (
+            asyncio.get_running_loop().create_future()
+        )
+
+    @property
+    def done(self) -> bool:
+        return self._result.done()
+
+    async def submit(self, interaction: "discord.Interaction", code: str) -> None:
+        """checks a submitted code and answers the interaction ephemerally"""
+        if interaction.user.id != self.user_id:
+            return await interaction.response.send_message(
+                content="This request is not yours.", ephemeral=True
+            )
+        if self.done:
+            return await interaction.response.send_message(
+                content="This request has already ended.", ephemeral=True
+            )
+        if self.verify(code.strip()):
+            self._result.set_result(True)
+            return await interaction.response.send_message(
+                content="Code verified.", ephemeral=True
+            )
+        self.attempts -= 1
+        if self.attempts <= 0:
+            self._result.set_result(False)
+            return await interaction.response.send_message(
+                content="Maximum attempts exceeded, Terminating process.",
+                ephemeral=True,
+            )
+        await interaction.response.send_message(
+            content=f"Wrong code. please try again...\n{self.attempts} remaining attempts.",
+            ephemeral=True,
+        )
+
+    async def wait(self, timeout: float) -> bool:
+        """returns the result, False on timeout, later submits are turned away"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._result), timeout)
+        except asyncio.TimeoutError:
+            if not self.done:
+                self._result.set_result(False)
+            return self._result.result()
+
+
+if HAS_MODALS:
+
+    class OTPModal(discord.ui.Modal, title="OTP verification"):
+        code = discord.ui.TextInput(
+            label="Code on your authenticator", min_length=6, max_length=6
+        )
+
+        def __init__(self, challenge: OTPChallenge) -> None:
+            super().__init__()
+            self.challenge = challenge
+
+        async def on_submit(self, interaction: discord.Interaction) -> None:
+            await self.challenge.submit(interaction, self.code.value)
+
+    class OTPView(discord.ui.View):
+        def __init__(self, challenge: OTPChallenge, *, timeout: float) -> None:
+            super().__init__(timeout=timeout)
+            self.challenge = challenge
+
+        async def interaction_check(self, interaction: discord.Interaction) -> bool:
+            if interaction.user.id != self.challenge.user_id:
+                await interaction.response.send_message(
+                    content="This request is not yours.", ephemeral=True
+                )
+                return False
+            return True
+
+        @discord.ui.button(label="Enter code", style=discord.ButtonStyle.primary)
+        async def enter_code(
+            self, interaction: discord.Interaction, button: discord.ui.Button
+        ) -> None:
+            await interaction.response.send_modal(OTPModal(self.challenge))
@@ -0,0 +1,3 @@
+from .dismiss import DismissManager, dismiss, replying
+from .utils import GREEN_TICK, GREY_TICK, RED_TICK, TYPING, make_discordcolor
+from .webhooks import MAX_WEBHOOKS, WebhookLimitReached, WebhookPool, pool
@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import math
+import time
+from typing import Coroutine, Dict, List, Optional, Set
+
+import discord
+from redbot.core import commands
+from redbot.core.bot import Red
+
+from .utils import RED_TICK
+
+WHEEL_SLOTS = 64  # one slot per tick, longer timeouts wrap around
+WHEEL_TICK = 1.0  # seconds
+
+
+class Dismissable:
+    __slots__ = ("message", "user_id", "emoji", "deadline")
+
+    def __init__(
+        self, message: discord.Message, user_id: int, emoji: str, deadline: float
+    ) -> None:
+        self.message = message
+        self.user_id = user_id
+        self.emoji = emoji
+        self.deadline = deadline
+
+
+class DismissManager:
+    """
+    Deletes replies when their author reacts with the dismiss emoji
+
+    One raw reaction listener looks pending messages up by id,
+    and a timer wheel clears the emoji of the ones left alone,
+    so no reply keeps a wait_for or a coroutine alive.
+    """
+
+    def __init__(self) -> None:
+        self._bot: Optional[Red] = None
+        self._pending: Dict[int, Dismissable] = {}
+        self._wheel: List[Set[int]] = [set() for _ in range(WHEEL_SLOTS)]
+        self._cursor = 0
+        self._ticker: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        """create_task, holding a reference until it is done"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _place(self, message_id: int, delay: float) -> None:
+        # one extra tick, the cursor may be anywhere into its current tick
+        ticks = min(WHEEL_SLOTS - 1, max(0, math.ceil(delay / WHEEL_TICK)) + 1)
+        self._wheel[(self._cursor + ticks) % WHEEL_SLOTS].add(message_id)
+
+    def attach(self, bot: Red) -> None:
+        """registers the reaction listener, once per bot"""
+        if self._bot is bot:
+            return
+        if self._bot is not None:
+            self._bot.remove_listener(self.on_raw_reaction_add, "on_raw_reaction_add")
+        bot.add_listener(self.on_raw_reaction_add, "on_raw_reaction_add")
+        self._bot = bot
+
+    def track(
+        self,
+        message: discord.Message,
+        user_id: int,
+        *,
+        timeout: float = 30.0,
+        emoji: str = RED_TICK,
+    ) -> None:
+        self._pending[message.id] = Dismissable(
+            message, user_id, emoji, time.monotonic() + timeout
+        )
+        self._place(message.id, timeout)
+        if self._ticker is None or self._ticker.done():
+            self._ticker = self._spawn(self._tick())
+
+    def forget(self, message_id: int) -> None:
+        """stops tracking a message, its wheel slot is cleaned up lazily"""
+        self._pending.pop(message_id, None)
+
+    async def _tick(self) -> None:
+        while self._pending:
+            await asyncio.sleep(WHEEL_TICK)
+            self._cursor = (self._cursor + 1) % WHEEL_SLOTS
+            slot, now = self._wheel[self._cursor], time.monotonic()
+            for message_id in list(slot):
+                slot.discard(message_id)
+                entry = self._pending.get(message_id)
+                if entry is None:
+                    continue
+                if entry.deadline <= now:
+                    del self._pending[message_id]
+                    self._spawn(self._expire(entry))
+                else:
+                    # timeouts longer than the wheel go around again
+                    self._place(message_id, entry.deadline - now)
+
+    async def _expire(self, entry: Dismissable) -> None:
+        with contextlib.suppress(discord.HTTPException):
+            await entry.message.remove_reaction(entry.emoji, self._bot.user)
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        entry = self._pending.get(payload.message_id)
+        if entry is None:
+            return
+        if payload.user_id != entry.user_id or str(payload.emoji) != entry.emoji:
+            return
+        del self._pending[payload.message_id]
+        with contextlib.suppress(discord.HTTPException):
+            await entry.message.delete()
+
+    async def _add_reaction(self, entry: Dismissable) -> None:
+        try:
+            await entry.message.add_reaction(entry.emoji)
+        except discord.HTTPException:
+            self.forget(entry.message.id)
+
+    def dismissable(
+        self,
+        ctx: commands.Context,
+        message: discord.Message,
+        *,
+        timeout: float = 30.0,
+        emoji: str = RED_TICK,
+    ) -> discord.Message:
+        """lets ctx.author delete message with emoji until timeout, without waiting"""
+        self.attach(ctx.bot)
+        self.track(message, ctx.author.id, timeout=timeout, emoji=emoji)
+        self._spawn(self._add_reaction(self._pending[message.id]))
+        return message
+
+
+dismiss = DismissManager()
+
+
+async def replying(
+    ctx: commands.Context,
+    *,
+    content: Optional[str] = None,
+    embed: Optional[discord.Embed] = None,
+    file: Optional[discord.File] = None,
+    mention_author: bool = False,
+    reference: bool = True,
+    delete_after: Optional[float] = None,
+    timeout: float = 30.0,
+) -> discord.Message:
+    """better reply, the author can dismiss it with RED_TICK until timeout"""
+    send = ctx.reply if reference else ctx.send
+    kwargs = {"mention_author": mention_author} if reference else {}
+    response = await send(
+        content=content,
+        embed=embed,
+        file=file,
+        delete_after=delete_after,
+        **kwargs,
+    )
+    return dismiss.dismissable(ctx, response, timeout=timeout)
@@ -0,0 +1,21 @@
+import functools
+import hashlib
+
+import discord
+
+RED_TICK = "<:redTick:901080156217704478>"
+GREEN_TICK = "<:greenTick:901080153873068052>"
+GREY_TICK = "<:greyTick:901080154992967691>"
+TYPING = "<:typing:901080160680419419>"
+
+
+@functools.lru_cache(maxsize=1024)
+def make_discordcolor(text: str) -> discord.Color:
+    """stable pastel color derived from text"""
+    hashed = str(int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % (10 ** 9))
+    r = int(hashed[:3]) % 100
+    g = int(hashed[3:6]) % 100
+    b = int(hashed[6:]) % 100
+
+    return discord.Color.from_rgb(r + 100, g + 100, b + 100)
+
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+import discord
+
+MAX_WEBHOOKS = 10  # discord's webhook limit per channel
+
+
+class WebhookLimitReached(Exception):
+    """raised when a channel has no usable webhook and no room for a new one"""
+
+
+class WebhookPool:
+    """
+    Per-channel cache of named webhooks, shared between cogs
+
+    Webhooks are looked up or created lazily, once per channel,
+    under a per-channel lock so concurrent requests never create duplicates.
+    When a channel is full, any webhook owned by the bot is reused,
+    since every send overrides the username and avatar anyway.
+    """
+
+    def __init__(self) -> None:
+        self._webhooks: Dict[Tuple[int, str], discord.Webhook] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def cached(self, channel_id: int, name: str) -> Optional[discord.Webhook]:
+        return self._webhooks.get((channel_id, name))
+
+    def put(self, channel_id: int, name: str, webhook: discord.Webhook) -> None:
+        self._webhooks[(channel_id, name)] = webhook
+
+    def evict(self, channel_id: int, name: Optional[str] = None) -> None:
+        """drops one webhook, or every webhook of the channel if no name is given"""
+        if name is not None:
+            self._webhooks.pop((channel_id, name), None)
+            return
+        for key in [key for key in self._webhooks if key[0] == channel_id]:
+            del self._webhooks[key]
+
+    async def get(self, channel: discord.TextChannel, *, name: str) -> discord.Webhook:
+        if (webhook := self.cached(channel.id, name)) is not None:
+            return webhook
+        lock = self._locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            if (webhook := self.cached(channel.id, name)) is not None:
+                return webhook
+            webhooks = await channel.webhooks()
+            me = channel.guild.me
+            # only reuse webhooks this bot made, never another integration's
+            owned = [
+                hook
+                for hook in webhooks
+                if hook.token is not None
+                and hook.user is not None
+                and hook.user.id == me.id
+            ]
+            webhook = discord.utils.get(owned, name=name)
+            if webhook is None and len(webhooks) >= MAX_WEBHOOKS:
+                webhook = next(iter(owned), None)
+                if webhook is None:
+                    raise WebhookLimitReached(channel)
+            elif webhook is None:
+                webhook = await channel.create_webhook(name=name)
+            self.put(channel.id, name, webhook)
+            return webhook
+
+    async def send(
+        self, channel: discord.TextChannel, *, name: str, **kwargs: Any
+    ) -> Optional[discord.WebhookMessage]:
+        """sends through the cached webhook, replacing it once if it was deleted"""
+        try:
+            return await (await self.get(channel, name=name)).send(**kwargs)
+        except discord.NotFound:
+            self.evict(channel.id, name)
+            return await (await self.get(channel, name=name)).send(**kwargs)
+
+
+pool = WebhookPool()
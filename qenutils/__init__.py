@@ -5,6 +5,11 @@ from redbot.core.bot import Red
 
 from .qenutils import Qenutils
 
+with open(Path(__file__).parent / "info.json") as fp:
+    __red_end_user_data_statement__ = json.load(fp)["end_user_data_statement"]
+
 
 async def setup(bot: Red) -> None:
-    bot.add_cog(Qenutils(bot))
+    cog = Qenutils(bot)
+    await cog.initialize()
+    bot.add_cog(cog)
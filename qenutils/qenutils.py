@@ -1,29 +1,53 @@
 import asyncio
+import contextlib
+import heapq
+import io
+import logging
 import math
 import re
-from datetime import timezone
+import time
+from datetime import timedelta, timezone
 from random import choice
-from typing import Literal, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 
 import discord
 from redbot.core import commands
 from redbot.core.bot import Red
 from redbot.core.config import Config
-from redbot.core.utils.chat_formatting import humanize_list, pagify
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, humanize_list, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu, start_adding_reactions
 from redbot.core.utils.predicates import ReactionPredicate
 
-from .utils import make_discordcolor, replying
+from .utils import (
+    HighlightDigest,
+    HighlightEntry,
+    HighlightMatcher,
+    NoteStore,
+    TAG_REGEX,
+    TodoPages,
+    VaultIndex,
+    parse_ranges,
+)
+
+try:
+    from cog_shared.qenucore import make_discordcolor, replying
+except ImportError:
+    from qenucore import make_discordcolor, replying
 
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
+_log = logging.getLogger("red.qenu.qenutils")
 # SNOWFLAKE_THRESHOLD = 2 ** 63
 OWNER_ID = set([164900704526401545])
 AUTHOR_ID = 164900704526401545
 
 EYES_NAMI = "<:eyes_nami:652251609765511200>"
 EYES_SORAKA = "<:eyes_soraka:549193008726278154>"
-HIGHLIGHT_KEYWORD = ["ba.", " ba "]
-HIGHLIGHT_REGEX = re.compile(r"(?i)\bba+\b")
+HIGHLIGHT_DEFAULT = r"\bba+\b"  # AUTHOR_ID's highlight before subscriptions existed
+MAX_HIGHLIGHTS = 25  # per user
+DIGEST_FIELDS = 20  # channels listed in one digest, below discord's 25 fields
+DIGEST_LENGTH = 5000  # characters of one digest, below discord's 6000
+NOTE_INLINE_LIMIT = 2000  # longer notes are stored as blobs and sent as files
 
 class Qenutils(commands.Cog):
     """
@@ -34,6 +58,7 @@ class Qenutils(commands.Cog):
     onping  bot responds basic infos on ping
     todo    todo list
     get     get notes
+    highlight   dm on keywords
 
     """
 
@@ -45,15 +70,143 @@ class Qenutils(commands.Cog):
             force_registration=True,
         )
 
-        default_global = {"server_link": "", "invite_link": False, "vault": {}}
+        default_global = {
+            "server_link": "",
+            "invite_link": False,
+            "vault": {},  # legacy, migrated into the NOTE group
+            "vault_migrated": False,
+            "highlight_migrated": False,
+            "todo_migrated": False,
+            "reminder_cursor": 0,  # due time of the last reminder sent
+        }
         default_user = {
-            "todo": [],  # list of dicts
+            "todo": [],  # legacy, migrated into "todos"
+            "todos": {},  # todo id -> {"link", "text", "timestamp", "tags", "due"}
+            "todo_next": 1,  # next todo id
+            "highlights": [],  # list of {"value": str, "regex": bool}
         }
 
         self.config.register_global(**default_global)
         self.config.register_user(**default_user)
+        self.config.init_custom("NOTE", 1)
+        # inline notes keep content, blob notes keep file, filename and size
+        self.config.register_custom(
+            "NOTE", content=None, file=None, filename=None, size=0
+        )
+        self.notes = NoteStore(cog_data_path(self) / "notes")
+
+        self._mention: Optional[re.Pattern] = None
+        if bot.user is not None:
+            self._compile_mention()
+
+        self.highlights = HighlightMatcher()
+        self.digest = HighlightDigest(self.send_digest)
+
+        self._app_info: Optional[discord.AppInfo] = None
+        self._todo_pages: Dict[int, TodoPages] = {}
+        self._vault: Optional[VaultIndex] = None
+        # (due, user id, todo id) of every pending reminder, for reminder_loop
+        self._reminders: List[Tuple[int, int, str]] = []
+        self._reminders_changed = asyncio.Event()
+        self._reminder_task: Optional[asyncio.Task] = None
+        # guild id -> (prefixes it was rendered with, mention reply embed)
+        self._mention_replies: Dict[int, Tuple[Tuple[str, ...], discord.Embed]] = {}
+
+    async def initialize(self) -> None:
+        if not await self.config.vault_migrated():
+            for keyword, content in (await self.config.vault()).items():
+                await self.config.custom("NOTE", keyword).set(
+                    {
+                        "content": content,
+                        "file": None,
+                        "filename": None,
+                        "size": len(content.encode("utf-8")),
+                    }
+                )
+            await self.config.vault.clear()
+            await self.config.vault_migrated.set(True)
+        if not await self.config.highlight_migrated():
+            async with self.config.user_from_id(AUTHOR_ID).highlights() as highlights:
+                highlights.append({"value": HIGHLIGHT_DEFAULT, "regex": True})
+            await self.config.highlight_migrated.set(True)
+        if not await self.config.todo_migrated():
+            for user_id, data in (await self.config.all_users()).items():
+                if data["todo"]:
+                    user = self.config.user_from_id(user_id)
+                    await user.todos.set(
+                        {str(index): item for index, item in enumerate(data["todo"], 1)}
+                    )
+                    await user.todo_next.set(len(data["todo"]) + 1)
+                    await user.todo.clear()
+            await self.config.todo_migrated.set(True)
+        cursor = await self.config.reminder_cursor()
+        for user_id, data in (await self.config.all_users()).items():
+            for item in data["highlights"]:
+                if item["regex"]:
+                    try:
+                        self.highlights.check(item["value"])
+                    except re.error:
+                        _log.warning(f"Skipping invalid highlight of {user_id}: {item['value']}")
+                        continue
+                self.highlights.add(user_id, item["value"], regex=item["regex"])
+            for todo_id, item in data["todos"].items():
+                if item.get("due") and item["due"] > cursor:
+                    self._reminders.append((item["due"], user_id, todo_id))
+        heapq.heapify(self._reminders)
+        self._reminder_task = asyncio.create_task(self.reminder_loop())
+
+    def schedule_reminder(self, due: int, user_id: int, todo_id: str) -> None:
+        heapq.heappush(self._reminders, (due, user_id, todo_id))
+        self._reminders_changed.set()
+
+    async def reminder_loop(self) -> None:
+        """one task sleeping until the earliest due todo of every user"""
+        await self.bot.wait_until_red_ready()
+        while True:
+            self._reminders_changed.clear()
+            if not self._reminders:
+                await self._reminders_changed.wait()
+                continue
+            due, user_id, todo_id = self._reminders[0]
+            if (delay := due - time.time()) > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._reminders_changed.wait(), delay)
+                continue
+            heapq.heappop(self._reminders)
+            try:
+                await self.remind(due, user_id, todo_id)
+            except Exception:
+                _log.exception(f"Failed to remind {user_id} of todo {todo_id}")
+            await self.config.reminder_cursor.set(due)
+
+    async def remind(self, due: int, user_id: int, todo_id: str) -> None:
+        """dms a due todo, unless it was removed or rescheduled meanwhile"""
+        item = await self.config.user_from_id(user_id).todos.get_raw(
+            todo_id, default=None
+        )
+        if item is None or item.get("due") != due:
+            return
+        if (user := self.bot.get_user(user_id)) is None:
+            return
+        e = discord.Embed(
+            title="Todo reminder",
+            description=f"{item['text']}\n\n[Original Message]({item['link']})",
+            color=await self.bot.get_embed_colour(user),
+        )
+        with contextlib.suppress(discord.HTTPException):
+            await user.send(embed=e)
+
+    def _compile_mention(self) -> None:
+        self._mention = re.compile(rf"^<@!?{self.bot.user.id}>$")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self._compile_mention()
 
     def cog_unload(self):
+        self.digest.close()
+        if self._reminder_task is not None:
+            self._reminder_task.cancel()
         self.bot.owner_ids = OWNER_ID
         return super().cog_unload()
 
@@ -68,7 +221,9 @@ class Qenutils(commands.Cog):
         I SHAMELESSLY STOLE THIS FROM RED
         https://github.com/Cog-Creators/Red-DiscordBot
         """
-        app_info = await self.bot.application_info()
+        if self._app_info is None:
+            self._app_info = await self.bot.application_info()
+        app_info = self._app_info
         data = await self.bot._config.all()
         commands_scope = data["invite_commands_scope"]
         scopes = ("bot", "applications.commands") if commands_scope else None
@@ -99,6 +254,7 @@ class Qenutils(commands.Cog):
                 ctx=ctx,
             )
         await self.config.invite_link.set(on_off)
+        self._mention_replies.clear()
         return await replying(
             embed=discord.Embed(
                 description=f"Invite links are now **{'enabled'if on_off else 'disabled'}**.",
@@ -115,6 +271,7 @@ class Qenutils(commands.Cog):
             await self.config.server_link.set("")
         else:
             await self.config.server_link.set(invite_link)
+        self._mention_replies.clear()
         return await replying(
             embed=discord.Embed(
                 description=f"Support server link has been {'disabled' if invite_link is None else f'set to {invite_link}'}.",
@@ -124,7 +281,7 @@ class Qenutils(commands.Cog):
             ctx=ctx,
         )
 
-    async def highlighted(self, message: discord.Message):
+    async def highlighted(self, message: discord.Message, *, user_id: int, trigger: str):
         embed = discord.Embed()
         embed.set_author(
             name=f"{message.author.display_name}",
@@ -139,7 +296,7 @@ class Qenutils(commands.Cog):
         if message.attachments:
             embed.set_image(url=message.attachments[0].url)
         embed.set_footer(
-            text=f"Guild ID: {message.guild.id} • User ID: {message.author.id}\nSent from Highlight Message"
+            text=f"Guild ID: {message.guild.id} • User ID: {message.author.id}\nHighlighted by {trigger}"
         )
         embed.add_field(
             name="Content",
@@ -147,29 +304,93 @@ class Qenutils(commands.Cog):
             inline=False,
         )
         embed.color = make_discordcolor(f"{message.author.id}")
-        me = self.bot.get_user(AUTHOR_ID)
+        if (me := self.bot.get_user(user_id)) is None:
+            return
         return await me.send(embed=embed)
 
+    async def send_digest(self, user_id: int, entries: List[HighlightEntry]):
+        """sends buffered highlights, as the usual embed when there is only one"""
+        if len(entries) == 1 and entries[0].count == 1:
+            entry = entries[0]
+            return await self.highlighted(
+                entry.message, user_id=user_id, trigger=entry.trigger
+            )
+        if (me := self.bot.get_user(user_id)) is None:
+            return
+        embed = discord.Embed(
+            title="Highlights",
+            description=f"{sum(entry.count for entry in entries)} highlighted messages",
+            color=await self.bot.get_embed_colour(me),
+        )
+        for shown, entry in enumerate(entries):
+            message = entry.message
+            more = f" (+{entry.count - 1} more)" if entry.count > 1 else ""
+            name = f"#{message.channel.name} • {message.guild.name}{more}"[:256]
+            value = (
+                f"[{message.author.display_name}]({message.jump_url}): "
+                f"{message.content[:200]}"
+            )[:1024]
+            if (
+                shown >= DIGEST_FIELDS
+                or len(embed) + len(name) + len(value) > DIGEST_LENGTH
+            ):
+                embed.description += f"\n+{len(entries) - shown} more channels"
+                break
+            embed.add_field(name=name, value=value, inline=False)
+        return await me.send(embed=embed)
+
+    def can_highlight(self, message: discord.Message, user_id: int) -> bool:
+        """subscribers are only told about messages they could read themselves"""
+        if user_id == message.author.id:
+            return False
+        member = message.guild.get_member(user_id)
+        return member is not None and message.channel.permissions_for(member).read_messages
+
     @commands.Cog.listener()
     async def on_message_without_command(self, message: discord.Message):
+        # cheap checks first, awaits only for messages that are acted upon
         if message.author.bot:
             return
         if not message.guild:
             return
+        content = message.content
+        highlight = self.highlights.match(content)
+        mention = (
+            not highlight
+            and content.startswith("<@")
+            and self._mention is not None
+            and self._mention.match(content)
+        )
+        if not (highlight or mention):
+            return
         if await self.bot.allowed_by_whitelist_blacklist(who=message.author) is False:
             return
-        if (
-            re.search(HIGHLIGHT_REGEX, message.content)
-            or message.content.lower() == "ba"
-        ):
-            await message.add_reaction(choice([EYES_NAMI, EYES_SORAKA]))
-            return await self.highlighted(message=message)
-        if not message.channel.permissions_for(message.guild.me).send_messages:
+        if highlight:
+            if AUTHOR_ID in highlight:
+                await message.add_reaction(choice([EYES_NAMI, EYES_SORAKA]))
+            for user_id, trigger in highlight.items():
+                if self.can_highlight(message, user_id):
+                    self.digest.add(user_id, message, trigger)
             return
-        if not re.compile(rf"^<@!?{self.bot.user.id}>$").match(message.content):
+        if not message.channel.permissions_for(message.guild.me).send_messages:
             return
         prefixes = await self.bot.get_prefix(message)
-        prefixes.remove(f"<@!{self.bot.user.id}> ")
+        cached = self._mention_replies.get(message.guild.id)
+        if cached is not None and cached[0] == tuple(prefixes):
+            return await message.reply(embed=cached[1], mention_author=False)
+        embed = await self._mention_reply(message, prefixes)
+        if embed is None:
+            return
+        self._mention_replies[message.guild.id] = (tuple(prefixes), embed)
+        await message.reply(embed=embed, mention_author=False)
+
+    async def _mention_reply(
+        self, message: discord.Message, prefixes: List[str]
+    ) -> Optional[discord.Embed]:
+        """renders the reply to a bare bot mention"""
+        prefixes = [
+            prefix for prefix in prefixes if prefix != f"<@!{self.bot.user.id}> "
+        ]
         sorted_prefixes = sorted(prefixes, key=len)
         if len(sorted_prefixes) > 500:
             return
@@ -190,36 +411,80 @@ class Qenutils(commands.Cog):
                 f"\nLooking to invite me? [Click here!]({await self._invite_url()})"
             )
 
-        embed = discord.Embed(
+        return discord.Embed(
             colour=await self.bot.get_embed_colour(message.channel),
             description=descript,
         )
-        await message.reply(embed=embed, mention_author=False)
+
+    @commands.group(name="highlight", aliases=["hl"], invoke_without_command=True)
+    async def qenu_highlight(self, ctx: commands.Context):
+        """Get a dm when your keywords are said"""
+        highlights = await self.config.user(ctx.author).highlights()
+        message = "\n".join(
+            f"{'regex' if item['regex'] else 'word '} {item['value']}"
+            for item in highlights
+        )
+        return await replying(
+            embed=discord.Embed(
+                description=box(message or "No highlights yet."),
+                color=await ctx.embed_color(),
+            ),
+            mention_author=False,
+            ctx=ctx,
+        )
+
+    async def _highlight_add(self, ctx: commands.Context, value: str, *, regex: bool):
+        async with self.config.user(ctx.author).highlights() as highlights:
+            if {"value": value, "regex": regex} in highlights:
+                return await ctx.send(f"`{value}` is already highlighted.")
+            if len(highlights) >= MAX_HIGHLIGHTS:
+                return await ctx.send(f"You can only have {MAX_HIGHLIGHTS} highlights.")
+            highlights.append({"value": value, "regex": regex})
+        self.highlights.add(ctx.author.id, value, regex=regex)
+        await ctx.tick()
+
+    @qenu_highlight.command(name="add")
+    async def qenu_highlight_add(self, ctx: commands.Context, *, keyword: str):
+        """Highlight a word or phrase"""
+        await self._highlight_add(ctx, keyword, regex=False)
+
+    @qenu_highlight.command(name="regex")
+    @commands.is_owner()
+    async def qenu_highlight_regex(self, ctx: commands.Context, *, pattern: str):
+        """Highlight a regex pattern, always case insensitive"""
+        try:
+            self.highlights.check(pattern)
+        except re.error as e:
+            return await ctx.send(f"Invalid pattern: `{e}`")
+        await self._highlight_add(ctx, pattern, regex=True)
+
+    @qenu_highlight.command(name="remove")
+    async def qenu_highlight_remove(self, ctx: commands.Context, *, value: str):
+        """Remove a highlighted word or pattern"""
+        async with self.config.user(ctx.author).highlights() as highlights:
+            removed = [item for item in highlights if item["value"] == value]
+            highlights[:] = [item for item in highlights if item["value"] != value]
+        if not removed:
+            return await ctx.send(f"`{value}` is not highlighted.")
+        for item in removed:
+            self.highlights.remove(ctx.author.id, value, regex=item["regex"])
+        await ctx.tick()
+
+    async def todo_pages(self, user: discord.abc.User) -> TodoPages:
+        """cached todo pages of a user, loaded once until the list changes"""
+        if (pages := self._todo_pages.get(user.id)) is None:
+            todos = await self.config.user(user).todos()
+            pages = self._todo_pages[user.id] = TodoPages(
+                sorted(todos.items(), key=lambda item: int(item[0]))
+            )
+        return pages
 
     @commands.command(name="todo", aliases=["todos"])
     async def qenu_todo(self, ctx: commands.Context, *, text: Optional[str]):
         """Personal todo list, append a message to add to it"""
         if text is None:
-            message = ""
-            todo = await self.config.user(ctx.author).todo()
-            if len(todo) == 0:
-                message += "```\nNothing to see here, head empty.\n...uwu```"
-            else:
-                for index, item in enumerate(todo):
-                    message += f"[{index+1:02d}.]({item['link']}) **{item['text'].capitalize()}** • <t:{item['timestamp']}:R>\n"
-            embeds = []
-            pages = 1
-            for page in pagify(message, delims=["\n"], page_length=1000):
-                e = discord.Embed(
-                    color=ctx.author.color,
-                    description=f"{page}",
-                )
-                e.set_author(name=f"{ctx.author}", icon_url=ctx.author._user.avatar.url)
-                e.set_footer(text=f"Page {pages}/{(math.ceil(len(message) / 1000))}")
-                pages += 1
-                embeds.append(e)
-
-            await menu(ctx, embeds, DEFAULT_CONTROLS)
+            pages = await self.todo_pages(ctx.author)
+            await pages.bind(ctx.author, ctx.author.color).show(ctx)
 
         else:
             d = {}
@@ -228,19 +493,84 @@ class Qenutils(commands.Cog):
             d["timestamp"] = int(
                 ctx.message.created_at.replace(tzinfo=timezone.utc).timestamp()
             )
+            d["tags"] = sorted({tag.lower() for tag in TAG_REGEX.findall(text)})
 
-            async with self.config.user(ctx.author).todo() as todo:
-                todo.append(d.copy())
+            user = self.config.user(ctx.author)
+            async with user.todo_next.get_lock():
+                todo_id = await user.todo_next()
+                await user.todo_next.set(todo_id + 1)
+                await user.todos.set_raw(str(todo_id), value=d)
+                if (pages := self._todo_pages.get(ctx.author.id)) is not None:
+                    pages.append(str(todo_id), d)
 
             e = discord.Embed(
                 title="Added todo",
-                description=f"{text}\n\n<t:{int(ctx.message.created_at.replace(tzinfo=timezone.utc).timestamp())}:F>",
+                description=f"{text}\n\n<t:{d['timestamp']}:F>",
                 color=await ctx.embed_color(),
             )
             e.set_author(name=f"{ctx.author}", icon_url=ctx.author._user.avatar.url)
 
             await replying(embed=e, mention_author=False, ctx=ctx)
 
+    async def _update_todo(self, ctx: commands.Context, index: int, **changes):
+        """updates fields of a todo by 1-based index, returns it or None if invalid"""
+        pages = await self.todo_pages(ctx.author)
+        if not 0 < index <= len(pages.items):
+            await self.rmdo_invalid_index(ctx, invalids=[str(index)])
+            return None
+        todo_id, item = pages.items[index - 1]
+        for key, value in changes.items():
+            await self.config.user(ctx.author).todos.set_raw(todo_id, key, value=value)
+        item.update(changes)
+        pages.refresh()
+        return todo_id, item
+
+    @commands.command(name="todotag")
+    async def qenu_todo_tag(self, ctx: commands.Context, index: int, *tags: str):
+        """Set the tags of a todo, leave blank to clear them"""
+        tags = sorted({tag.lstrip("#").lower() for tag in tags if tag.lstrip("#")})
+        if await self._update_todo(ctx, index, tags=tags) is not None:
+            await ctx.tick()
+
+    @commands.command(name="tododue")
+    async def qenu_todo_due(
+        self,
+        ctx: commands.Context,
+        index: int,
+        *,
+        duration: Optional[commands.TimedeltaConverter] = None,
+    ):
+        """Remind me about a todo after a duration like `2h30m`, leave blank to clear"""
+        due = (
+            int(time.time() + duration.total_seconds())
+            if isinstance(duration, timedelta)
+            else None
+        )
+        if (result := await self._update_todo(ctx, index, due=due)) is None:
+            return
+        if due is None:
+            return await ctx.tick()
+        self.schedule_reminder(due, ctx.author.id, result[0])
+        await replying(
+            content=f"I will remind you <t:{due}:R>.", mention_author=False, ctx=ctx
+        )
+
+    @commands.command(name="todofind")
+    async def qenu_todo_find(self, ctx: commands.Context, *, query: str):
+        """Search your todos by words and #tags"""
+        pages = await self.todo_pages(ctx.author)
+        found = pages.search(query)
+        if not found:
+            return await ctx.send(f"No todo matching `{query}`.")
+        message = "\n".join(pages.line(index) for index in found)
+        embeds = []
+        for number, page in enumerate(pagify(message, page_length=1000), start=1):
+            e = discord.Embed(color=ctx.author.color, description=page)
+            e.set_author(name=f"Search • {query}", icon_url=ctx.author.display_avatar.url)
+            e.set_footer(text=f"{len(found)} found • Page {number}")
+            embeds.append(e)
+        await menu(ctx, embeds, DEFAULT_CONTROLS)
+
     async def rmdo_invalid_index(self, ctx: commands.Context, *, invalids):
         """reply function"""
         return await replying(
@@ -254,114 +584,140 @@ class Qenutils(commands.Cog):
 
     @commands.command(name="rmdo")
     async def qenu_remove_todo(self, ctx: commands.Context, *, content: str):
-        """Remove from todo list with index"""
-        queue = content.split()
-        if len(queue) == 1:  # only one to remove
-            if not queue[0].isdigit():
-                return await self.rmdo_invalid_index(ctx, invalids=queue)
-            index = int(queue[0])
-            if index > len(await self.config.user(ctx.author).todo()):
-                return await self.rmdo_invalid_index(ctx, invalids=[index])
-            async with self.config.user(ctx.author).todo() as todo:
-                item = todo.pop(index - 1)
-            message = item["text"]
-            timestamp = item["timestamp"]
-            jump_url = item["link"]
-            e = discord.Embed(
-                title="Removed todo",
-                description=(
-                    f"```\n"
-                    f"{message}```\n"
-                    f"**Created at** • <t:{timestamp}:F>\n"
-                    f"[Original Message]({jump_url})"
-                ),
-                color=ctx.author.color,
-            )
-            return await replying(embed=e, mention_author=False, ctx=ctx)
+        """Remove from todo list with indexes or ranges, like `3 5-7`"""
+        items = (await self.todo_pages(ctx.author)).items
+        remove, invald = parse_ranges(content, len(items))
+        if not remove:
+            return await self.rmdo_invalid_index(ctx, invalids=invald or [content])
+
+        removed_ids = {items[index - 1][0] for index in remove}
+        async with self.config.user(ctx.author).todos() as todos:
+            for todo_id in removed_ids:
+                todos.pop(todo_id, None)
+        self._todo_pages[ctx.author.id] = TodoPages(
+            [item for item in items if item[0] not in removed_ids]
+        )
 
-        else:  # multiple removes
-            invald = []
-            indexes = list(
-                filter(
-                    None,
-                    [int(i) if i.isdigit() else invald.append(i) for i in queue],
-                )
+        descript = []
+        for index in remove:
+            item = items[index - 1][1]
+            descript.append(
+                f"```\n{item['text']}```\n**Created at** • <t:{item['timestamp']}:F>\n[Original Message]({item['link']})\n\n"
             )
 
-            async with self.config.user(ctx.author).todo() as todo:
-                remove = []
-                length = len(todo)
-                descript = []
-                for index in indexes:
-                    if index > length:
-                        invald.append(str(index))
-                    else:
-                        remove.append(index)
-                for index in sorted(remove, reverse=True):
-                    item = todo.pop(index - 1)
-                    message = item["text"]
-                    timestamp = item["timestamp"]
-                    jump_url = item["link"]
-                    descript.append(
-                        f"```\n{message}```\n**Created at** • <t:{timestamp}:F>\n[Original Message]({jump_url})\n\n"
-                    ),
-
-            descript.reverse()
+        if len(remove) == 1 and not invald:
             e = discord.Embed(
-                title="Removed todos",
-                description=(
-                    f"**Invalid indexes:** {humanize_list(invald)}\n"
-                    f"**Removed:** {humanize_list(sorted(remove))}\n"
-                    f"{''.join(descript)}"
-                ),
+                title="Removed todo",
+                description=descript[0],
                 color=ctx.author.color,
             )
             return await replying(embed=e, mention_author=False, ctx=ctx)
 
+        e = discord.Embed(
+            title="Removed todos",
+            description=(
+                f"**Invalid indexes:** {humanize_list(invald) if invald else 'None'}\n"
+                f"**Removed:** {humanize_list([str(index) for index in remove])}\n"
+                f"{''.join(descript)}"
+            )[:4096],
+            color=ctx.author.color,
+        )
+        return await replying(embed=e, mention_author=False, ctx=ctx)
+
+    async def vault_index(self) -> VaultIndex:
+        """note metadata, loaded from config once"""
+        if self._vault is None:
+            self._vault = VaultIndex(await self.config.custom("NOTE").all())
+        return self._vault
+
     @commands.command(name="get")
     async def qenu_get(self, ctx: commands.Context, *, keyword: str):
         """Gets a note with keyword"""
-        vault = await self.config.vault()
-        if isinstance(vault.get(keyword, None), type(None)):
-            await ctx.message.add_reaction("❓")
-            await asyncio.sleep(6)
-            return await ctx.message.remove_reaction("❓", ctx.me)
+        vault = await self.vault_index()
+        note = vault.get(keyword, None)
+        if note is None:
+            if suggestions := vault.suggest(keyword):
+                return await replying(
+                    content=f"Did you mean {humanize_list([f'`{key}`' for key in suggestions], style='or')}?",
+                    mention_author=False,
+                    ctx=ctx,
+                )
+            return await replying(
+                content="No note found for that keyword.",
+                mention_author=False,
+                ctx=ctx,
+            )
 
+        if note["file"] is None:
+            return await replying(
+                content=f"{note['content']}", mention_author=False, ctx=ctx
+            )
+        try:
+            data = await self.notes.read(note["file"])
+        except FileNotFoundError:
+            _log.warning(f"Blob {note['file']} of note {keyword} is missing")
+            return await ctx.message.add_reaction("❓")
         return await replying(
-            content=f"{vault[keyword]}", mention_author=False, ctx=ctx
+            file=discord.File(io.BytesIO(data), filename=note["filename"]),
+            mention_author=False,
+            ctx=ctx,
         )
 
     @commands.command(name="note")
     @commands.is_owner()
-    async def qenu_note(self, ctx: commands.Context, keyword: str, *, content: str):
-        """Sets a note with a keyword"""
-        async with self.config.vault() as vault:
-            if not vault.get(keyword, None) is None:
-                msg: discord.Message = await ctx.reply(
-                    embed=discord.Embed(
-                        description=f"`{keyword}` currently in use, do you want to overwrite it?",
-                        color=await ctx.embed_color(),
-                    ),
+    async def qenu_note(
+        self, ctx: commands.Context, keyword: str, *, content: Optional[str] = None
+    ):
+        """Sets a note with a keyword
+
+        attach a file to store it as the note, long notes are sent back as files
+        """
+        if content is None and not ctx.message.attachments:
+            return await ctx.send_help()
+        vault = await self.vault_index()
+        if keyword in vault:
+            msg: discord.Message = await ctx.reply(
+                embed=discord.Embed(
+                    description=f"`{keyword}` currently in use, do you want to overwrite it?",
+                    color=await ctx.embed_color(),
+                ),
+                mention_author=False,
+            )
+            start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
+            pred = ReactionPredicate.yes_or_no(msg, ctx.author)
+            try:
+                await ctx.bot.wait_for("reaction_add", check=pred, timeout=30)
+            except asyncio.TimeoutError:
+                return await msg.delete()
+            if pred.result is False:
+                # User responded with cross
+                await msg.remove_reaction(ReactionPredicate.YES_OR_NO_EMOJIS)
+                return await replying(
+                    embed=discord.Embed(description=f"Cancelled.", color=0xE74C3C),
                     mention_author=False,
+                    delete_after=10,
+                    ctx=ctx,
                 )
-                start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-                pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-                try:
-                    await ctx.bot.wait_for("reaction_add", check=pred, timeout=30)
-                except asyncio.TimeoutError:
-                    return await msg.delete()
-                if pred.result is False:
-                    # User responded with cross
-                    await msg.remove_reaction(ReactionPredicate.YES_OR_NO_EMOJIS)
-                    return await replying(
-                        embed=discord.Embed(description=f"Cancelled."),
-                        color=0xE74C3C,
-                        mention_author=False,
-                        delete_after=10,
-                        ctx=ctx,
-                    )
-                await msg.delete()
-            vault[keyword] = content
+            await msg.delete()
+
+        if ctx.message.attachments:
+            attachment = ctx.message.attachments[0]
+            data, filename = await attachment.read(), attachment.filename
+        else:
+            data, filename = content.encode("utf-8"), f"{keyword}.txt"
+        if ctx.message.attachments or len(content) > NOTE_INLINE_LIMIT:
+            note = {
+                "content": None,
+                "file": await self.notes.write(keyword, data),
+                "filename": filename,
+                "size": len(data),
+            }
+        else:
+            if (old := vault.get(keyword, None)) is not None and old["file"]:
+                self.notes.delete(old["file"])
+            note = {"content": content, "file": None, "filename": None, "size": len(data)}
+        await self.config.custom("NOTE", keyword).set(note)
+        vault.set(keyword, note)
         await replying(
             content=f"Keyword `{keyword}` set.",
             mention_author=False,
@@ -371,7 +727,7 @@ class Qenutils(commands.Cog):
     @commands.group(name="notes", invoke_without_command=True)
     async def qenu_notes(self, ctx: commands.Context):
         """display all saved notes"""
-        vault = await self.config.vault()
+        vault = await self.vault_index()
         message = ""
         for item in vault:
             message += f"{item}\t"
@@ -391,26 +747,30 @@ class Qenutils(commands.Cog):
     @qenu_notes.command(name="remove")
     async def qenu_notes_remove(self, ctx: commands.Context, keyword: str):
         """Removes a keyword from notes"""
-        async with self.config.vault() as vault:
-            if vault.get(keyword, None) is not None:
-                del vault[keyword]
-                return await replying(
-                    embed=discord.Embed(description=f"`{keyword}` removed from notes."),
-                    color=ctx.embed_color(),
-                    mention_author=False,
-                    delete_after=10,
-                    ctx=ctx,
-                )
-            else:
-                return await replying(
-                    embed=discord.Embed(
-                        description=f"Keyword `{keyword}` not in notes."
-                    ),
-                    color=0x2F3136,
-                    mention_author=False,
-                    delete_after=10,
-                    ctx=ctx,
-                )
+        vault = await self.vault_index()
+        if (note := vault.get(keyword, None)) is not None:
+            await self.config.custom("NOTE", keyword).clear()
+            vault.remove(keyword)
+            if note["file"]:
+                self.notes.delete(note["file"])
+            return await replying(
+                embed=discord.Embed(
+                    description=f"`{keyword}` removed from notes.",
+                    color=await ctx.embed_color(),
+                ),
+                mention_author=False,
+                delete_after=10,
+                ctx=ctx,
+            )
+        else:
+            return await replying(
+                embed=discord.Embed(
+                    description=f"Keyword `{keyword}` not in notes.", color=0x2F3136
+                ),
+                mention_author=False,
+                delete_after=10,
+                ctx=ctx,
+            )
 
     def is_owners(ctx):
         return ctx.message.author.id in OWNER_ID
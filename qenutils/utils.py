@@ -1,59 +1,604 @@
 import asyncio
+import bisect
 import contextlib
 import hashlib
-from typing import Any, Dict, List, Optional
+import logging
+import math
+import re
+import time
+import zlib
+from pathlib import Path
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import discord
 from redbot.core import commands
+from redbot.core.utils.menus import close_menu, menu
 
-RED_TICK = "<:redTick:901080156217704478>"
-GREEN_TICK = "<:greenTick:901080153873068052>"
-GREY_TICK = "<:greyTick:901080154992967691>"
-TYPING = "<:typing:901080160680419419>"
-
-
-def make_discordcolor(text: str) -> discord.Color:
-    hashed = str(int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % (10 ** 9))
-    r = int(hashed[:3]) % 100
-    g = int(hashed[3:6]) % 100
-    b = int(hashed[6:]) % 100
-
-    return discord.Color.from_rgb(r + 100, g + 100, b + 100)
-
-
-async def replying(
-    embed: Optional[discord.Embed] = None,
-    content: Optional[str] = None,
-    mention_author: Optional[bool] = False,
-    **kwargs: Any
-):
-    """better reply"""
-    ctx = kwargs.get("ctx", None)
-    response = await ctx.reply(
-        content=content,
-        embed=embed,
-        mention_author=mention_author,
-    )
-
-    await response.add_reaction(RED_TICK)
-
-    try:
-        reaction, user = await ctx.bot.wait_for(
-            "reaction_add",
-            timeout=30.0,
-            check=lambda reaction, user: user.id == ctx.author.id
-            and str(reaction.emoji) == RED_TICK
-            and reaction.message.id == response.id,
+_log = logging.getLogger("red.qenu.qenutils")
+
+TODOS_PER_PAGE = 10
+TAG_REGEX = re.compile(r"(?<!\w)#(\w+)")
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over lowercase literals,
+    finds every keyword in a text with a single pass
+    """
+
+    def __init__(self, keywords: List[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for keyword in keywords:
+            self._insert(keyword)
+        self._link()
+
+    def _insert(self, keyword: str) -> None:
+        state = 0
+        for char in keyword:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._out[state].append(keyword)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] += self._out[self._fail[child]]
+
+    def iter(self, text: str):
+        """yields (end index, keyword) for every occurrence in text"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword in self._out[state]:
+                yield index, keyword
+
+
+def validate_pattern(pattern: str) -> None:
+    """raises re.error if pattern can't be part of the combined highlight regex"""
+    compiled = re.compile(pattern, re.IGNORECASE)
+    if compiled.groupindex or BACKREFERENCE.search(pattern):
+        raise re.error("named groups and backreferences are not allowed")
+    if compiled.search("") is not None:
+        raise re.error("pattern matches an empty message")
+
+
+class HighlightMatcher:
+    """
+    Highlight subscriptions of every user, compiled into one matcher
+
+    Keywords go into an Aho-Corasick automaton and match whole words,
+    behind one compiled alternation of them that rejects most messages
+    before the automaton walks them in python.
+    Patterns are joined into one case-insensitive alternation regex.
+    Only the side that changed is recompiled, on the next scan.
+    Overlapping pattern matches may hide each other.
+    """
+
+    def __init__(self) -> None:
+        self._keywords: Dict[str, Set[int]] = {}
+        self._patterns: Dict[str, Set[int]] = {}
+        self._automaton: Optional[AhoCorasick] = None
+        self._precheck: Optional[re.Pattern] = None
+        self._regex: Optional[re.Pattern] = None
+        self._groups: List[str] = []
+
+    def __bool__(self) -> bool:
+        return bool(self._keywords or self._patterns)
+
+    def add(self, user_id: int, value: str, *, regex: bool = False) -> None:
+        if regex:
+            self._patterns.setdefault(value, set()).add(user_id)
+            self._regex = None
+        else:
+            self._keywords.setdefault(value.lower(), set()).add(user_id)
+            self._automaton = None
+
+    def remove(self, user_id: int, value: str, *, regex: bool = False) -> None:
+        table = self._patterns if regex else self._keywords
+        key = value if regex else value.lower()
+        users = table.get(key, set())
+        users.discard(user_id)
+        if not users:
+            table.pop(key, None)
+        if regex:
+            self._regex = None
+        else:
+            self._automaton = None
+
+    @staticmethod
+    def _combine(patterns: List[str]) -> re.Pattern:
+        return re.compile(
+            "|".join(
+                f"(?P<p{index}>{pattern})" for index, pattern in enumerate(patterns)
+            ),
+            re.IGNORECASE,
         )
-    except asyncio.TimeoutError:
-        try:
-            await response.remove_reaction(RED_TICK, ctx.me)
-        except discord.HTTPException:
-            pass
-        except discord.errors.NotFound:
-            pass
-    else:
-        await response.delete()
+
+    def check(self, pattern: str) -> None:
+        """raises re.error unless pattern compiles alongside every current one"""
+        validate_pattern(pattern)
+        self._combine([*self._patterns, pattern])
+
+    def _compile(self) -> None:
+        if self._automaton is None and self._keywords:
+            self._automaton = AhoCorasick(list(self._keywords))
+            # same boundaries as match, [^\W_] being the alphanumerics
+            self._precheck = re.compile(
+                r"(?<![^\W_])(?:"
+                + "|".join(
+                    re.escape(keyword)
+                    for keyword in sorted(self._keywords, key=len, reverse=True)
+                )
+                + r")(?![^\W_])",
+                re.IGNORECASE,
+            )
+        if self._regex is None and self._patterns:
+            self._groups = list(self._patterns)
+            self._regex = self._combine(self._groups)
+
+    def match(self, content: str) -> Dict[int, str]:
+        """user id -> the first keyword or pattern that matched"""
+        if not self or not content:
+            return {}
+        self._compile()
+        matched: Dict[int, str] = {}
+        if self._keywords and self._precheck.search(content):
+            text = content.lower()
+            for end, keyword in self._automaton.iter(text):
+                start = end - len(keyword) + 1
+                if (start > 0 and text[start - 1].isalnum()) or (
+                    end + 1 < len(text) and text[end + 1].isalnum()
+                ):
+                    continue
+                for user_id in self._keywords[keyword]:
+                    matched.setdefault(user_id, keyword)
+        if self._patterns:
+            for found in self._regex.finditer(content):
+                pattern = self._groups[int(found.lastgroup[1:])]
+                for user_id in self._patterns[pattern]:
+                    matched.setdefault(user_id, pattern)
+        return matched
+
+
+class HighlightEntry:
+    """the first highlighted message of a channel, and how many followed"""
+
+    __slots__ = ("message", "trigger", "count")
+
+    def __init__(self, message: discord.Message, trigger: str) -> None:
+        self.message = message
+        self.trigger = trigger
+        self.count = 1
+
+
+class HighlightDigest:
+    """
+    Buffers highlights per recipient, one entry per channel,
+    and sends them together once the channels go quiet
+
+    A digest is sent `quiet` seconds after the latest highlight,
+    at most `max_delay` seconds after the first buffered one,
+    or right away once `max_entries` messages are buffered,
+    but never sooner than `cooldown` seconds after the previous one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, List[HighlightEntry]], Awaitable[Any]],
+        *,
+        quiet: float = 15.0,
+        max_delay: float = 120.0,
+        max_entries: int = 10,
+        cooldown: float = 60.0,
+    ) -> None:
+        self._send = send
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.max_entries = max_entries
+        self.cooldown = cooldown
+        self._pending: Dict[int, Dict[int, HighlightEntry]] = {}
+        self._first: Dict[int, float] = {}  # when the oldest pending highlight came in
+        self._counts: Dict[int, int] = {}  # pending messages, across channels
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._last_sent: Dict[int, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, user_id: int, message: discord.Message, trigger: str) -> None:
+        channels = self._pending.setdefault(user_id, {})
+        if (entry := channels.get(message.channel.id)) is not None:
+            entry.count += 1
+        else:
+            channels[message.channel.id] = HighlightEntry(message, trigger)
+        now = time.monotonic()
+        first = self._first.setdefault(user_id, now)
+        self._counts[user_id] = self._counts.get(user_id, 0) + 1
+        if self._counts[user_id] >= self.max_entries:
+            delay = 0.0
+        else:
+            delay = max(0.0, min(self.quiet, first + self.max_delay - now))
+        self._schedule(user_id, delay)
+
+    def _spawn(self, user_id: int) -> None:
+        task = asyncio.create_task(self.flush(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule(self, user_id: int, delay: float) -> None:
+        if user_id in self._last_sent:
+            delay = max(
+                delay, self._last_sent[user_id] + self.cooldown - time.monotonic()
+            )
+        if (timer := self._timers.pop(user_id, None)) is not None:
+            timer.cancel()
+        self._timers[user_id] = asyncio.get_running_loop().call_later(
+            delay, self._spawn, user_id
+        )
+
+    async def flush(self, user_id: int) -> None:
+        if (timer := self._timers.pop(user_id, None)) is not None:
+            timer.cancel()
+        entries = self._pending.pop(user_id, {})
+        self._first.pop(user_id, None)
+        self._counts.pop(user_id, None)
+        if entries:
+            self._last_sent[user_id] = time.monotonic()
+            try:
+                await self._send(user_id, list(entries.values()))
+            except discord.HTTPException as e:
+                _log.warning(f"Could not send highlights to {user_id}: {e}")
+
+    def close(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+
+def parse_ranges(content: str, size: int) -> Tuple[List[int], List[str]]:
+    """
+    parses "3 5-7,9" into [3, 5, 6, 7, 9], clamped to 1..size,
+    returns invalid or out of range tokens as well
+    """
+    indexes, invalid = set(), []
+    for token in content.replace(",", " ").split():
+        start, _, end = token.partition("-")
+        if start.isdigit() and (end.isdigit() or not _):
+            first, last = int(start), int(end or start)
+            if first <= last:
+                if first < 1 or last > size:
+                    invalid.append(token)
+                indexes.update(range(max(first, 1), min(last, size) + 1))
+                continue
+        invalid.append(token)
+    return sorted(indexes), invalid
+
+
+class TodoPages(Sequence):
+    """
+    A user's todo list as menu pages
+
+    Items are (id, item) pairs in list order, and a page's text
+    is only rendered the first time that page is shown.
+    Use `show` rather than passing this to red's menu directly,
+    which renders every page to check their types.
+    """
+
+    def __init__(self, items: List[Tuple[str, dict]]) -> None:
+        self.items = items
+        self._texts: Dict[int, str] = {}
+        self._words: Optional[Dict[str, Set[int]]] = None  # word or #tag -> indexes
+        self.author: Optional[discord.abc.User] = None
+        self.color: Optional[discord.Color] = None
+
+    def __len__(self) -> int:
+        return max(1, math.ceil(len(self.items) / TODOS_PER_PAGE))
+
+    def refresh(self) -> None:
+        """drops rendered pages and the search index after an item changed"""
+        self._texts.clear()
+        self._words = None
+
+    def append(self, todo_id: str, item: dict) -> None:
+        """adds an item, only the last page and its index entries change"""
+        self.items.append((todo_id, item))
+        index = len(self.items)
+        self._texts.pop((index - 1) // TODOS_PER_PAGE, None)
+        if self._words is not None:
+            for key in self._keys(item):
+                self._words.setdefault(key, set()).add(index)
+
+    @staticmethod
+    def _keys(item: dict) -> Set[str]:
+        keys = set(re.findall(r"\w+", item["text"].lower()))
+        keys.update(f"#{tag}" for tag in item.get("tags", []))
+        return keys
+
+    def search(self, query: str) -> List[int]:
+        """
+        1-based indexes of items containing every word and #tag of query,
+        falling back to a substring match when no whole word matches
+        """
+        if self._words is None:
+            self._words = {}
+            for index, (_, item) in enumerate(self.items, start=1):
+                for key in self._keys(item):
+                    self._words.setdefault(key, set()).add(index)
+        tags = {f"#{tag.lower()}" for tag in TAG_REGEX.findall(query)}
+        words = re.findall(r"\w+", TAG_REGEX.sub("", query).lower())
+        found: Optional[Set[int]] = None
+        for key in (*tags, *words):
+            matches = self._words.get(key, set())
+            found = matches.copy() if found is None else found & matches
+        if not found and words:
+            needle = TAG_REGEX.sub("", query).strip().lower()
+            found = {
+                index
+                for index, (_, item) in enumerate(self.items, start=1)
+                if needle in item["text"].lower()
+                and tags <= {f"#{tag}" for tag in item.get("tags", [])}
+            }
+        return sorted(found or [])
+
+    def line(self, index: int) -> str:
+        """renders the item at a 1-based index"""
+        item = self.items[index - 1][1]
+        text = item["text"].capitalize()
+        if len(text) > 200:
+            text = text[:199] + "…"
+        line = f"[{index:02d}.]({item['link']}) **{text}** • <t:{item['timestamp']}:R>"
+        if item.get("tags"):
+            line += " " + " ".join(f"`#{tag}`" for tag in item["tags"])
+        if item.get("due"):
+            line += f" • ⏰ <t:{item['due']}:R>"
+        return line
+
+    def bind(self, author: discord.abc.User, color: discord.Color) -> "TodoPages":
+        self.author, self.color = author, color
+        return self
+
+    def _lines(self, page: int) -> Iterator[str]:
+        start = page * TODOS_PER_PAGE
+        for index in range(start + 1, min(start + TODOS_PER_PAGE, len(self.items)) + 1):
+            yield self.line(index)
+
+    def __getitem__(self, page):
+        if isinstance(page, slice):
+            return [self[index] for index in range(*page.indices(len(self)))]
+        if page < 0:
+            page += len(self)
+        if not 0 <= page < len(self):
+            raise IndexError(page)
+        if page not in self._texts:
+            self._texts[page] = (
+                "\n".join(self._lines(page))
+                or "```\nNothing to see here, head empty.\n...uwu```"
+            )
+        e = discord.Embed(color=self.color, description=self._texts[page])
+        e.set_author(name=f"{self.author}", icon_url=self.author.display_avatar.url)
+        e.set_footer(text=f"Page {page + 1}/{len(self)}")
+        return e
+
+    async def show(self, ctx: commands.Context, *, page: int = 0, timeout: float = 30.0):
+        """red's menu, handed only the page being shown"""
+        current = page
+
+        async def turn(step: int, message: discord.Message):
+            nonlocal current
+            current = (current + step) % len(self)
+            return await menu(ctx, [self[current]], controls, message, 0, timeout)
+
+        async def previous(ctx, pages, _controls, message, page, timeout, emoji, **kwargs):
+            return await turn(-1, message)
+
+        async def following(ctx, pages, _controls, message, page, timeout, emoji, **kwargs):
+            return await turn(1, message)
+
+        controls = {"\N{CROSS MARK}": close_menu}
+        if len(self) > 1:
+            controls = {
+                "\N{LEFTWARDS BLACK ARROW}\N{VARIATION SELECTOR-16}": previous,
+                **controls,
+                "\N{BLACK RIGHTWARDS ARROW}\N{VARIATION SELECTOR-16}": following,
+            }
+        return await menu(ctx, [self[current]], controls, timeout=timeout)
+
+
+def edit_distance(a: str, b: str) -> int:
+    """levenshtein distance between two strings"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    BK-tree over lowercase words for edit distance queries,
+    removed words are only skipped until the next rebuild
+    """
+
+    def __init__(self, words: List[str] = ()) -> None:
+        self._root: Optional[Tuple[str, Dict[int, Any]]] = None
+        self._removed: Set[str] = set()
+        self._size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        self._removed.discard(word)
+        if self._root is None:
+            self._root = (word, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = (word, {})
+                self._size += 1
+                return
+            node = node[1][distance]
+
+    def remove(self, word: str) -> None:
+        self._removed.add(word)
+        if len(self._removed) > self._size // 2:
+            words = [word for word in self._walk() if word not in self._removed]
+            self.__init__(words)
+
+    def _walk(self) -> Iterator[str]:
+        stack = [self._root] if self._root else []
+        while stack:
+            word, children = stack.pop()
+            yield word
+            stack.extend(children.values())
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """(distance, word) pairs within max_distance, closest first"""
+        found, stack = [], [self._root] if self._root else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance and node_word not in self._removed:
+                found.append((distance, node_word))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class VaultIndex:
+    """
+    In-memory vault with a sorted key list for prefix search
+    and a BK-tree for near-miss suggestions
+    """
+
+    def __init__(self, notes: Dict[str, Any]) -> None:
+        self._notes = dict(notes)
+        self._keys = sorted(self._notes)
+        self._tree = BKTree([key.lower() for key in self._keys])
+        self._lower: Dict[str, Set[str]] = {}
+        for key in self._keys:
+            self._lower.setdefault(key.lower(), set()).add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._notes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._notes.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        if key not in self._notes:
+            bisect.insort(self._keys, key)
+            self._lower.setdefault(key.lower(), set()).add(key)
+            self._tree.add(key.lower())
+        self._notes[key] = value
+
+    def remove(self, key: str) -> None:
+        if self._notes.pop(key, None) is None:
+            return
+        del self._keys[bisect.bisect_left(self._keys, key)]
+        variants = self._lower[key.lower()]
+        variants.discard(key)
+        if not variants:
+            del self._lower[key.lower()]
+            self._tree.remove(key.lower())
+
+    def prefix(self, prefix: str, *, limit: int = 10) -> List[str]:
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for key in self._keys[start : start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append(key)
+        return matches
+
+    def suggest(self, key: str, *, limit: int = 5) -> List[str]:
+        """keys starting with key, then keys within a small edit distance"""
+        suggestions = self.prefix(key, limit=limit)
+        max_distance = 1 if len(key) <= 4 else 2
+        for _, lower in self._tree.search(key.lower(), max_distance):
+            for variant in sorted(self._lower.get(lower, ())):
+                if variant not in suggestions:
+                    suggestions.append(variant)
+        return suggestions[:limit]
+
+
+class NoteStore:
+    """
+    Compressed blobs for notes too large to keep in Config,
+    file names are derived from the keyword
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def blob_name(keyword: str) -> str:
+        return hashlib.sha1(keyword.encode("utf-8")).hexdigest() + ".zlib"
+
+    def _write(self, name: str, data: bytes) -> None:
+        tmp = self.path / (name + ".tmp")
+        tmp.write_bytes(zlib.compress(data))
+        tmp.replace(self.path / name)
+
+    def _read(self, name: str) -> bytes:
+        return zlib.decompress((self.path / name).read_bytes())
+
+    async def write(self, keyword: str, data: bytes) -> str:
+        name = self.blob_name(keyword)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, name, data)
+        return name
+
+    async def read(self, name: str) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, name)
+
+    def delete(self, name: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            (self.path / name).unlink()
 
 
 # class Selection(discord.ui.View):
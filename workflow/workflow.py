@@ -1,6 +1,5 @@
 import asyncio
 import ast
-import hashlib
 import json
 import re
 import time
@@ -17,7 +16,12 @@ from redbot.core.utils.chat_formatting import box, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu, start_adding_reactions
 from redbot.core.utils.predicates import ReactionPredicate
 
-from .utils import GREEN_TICK, GREY_TICK, RED_TICK, replying, send_x
+from .utils import replying, send_x
+
+try:
+    from cog_shared.qenucore import GREEN_TICK, GREY_TICK, RED_TICK, make_discordcolor
+except ImportError:
+    from qenucore import GREEN_TICK, GREY_TICK, RED_TICK, make_discordcolor
 
 RequestType = Literal["discord_deleted_user", "owner", "user", "user_strict"]
 
@@ -35,15 +39,6 @@ def privileged(ctx):
     return ctx.author.id in PRIVILEGED_USERS
 
 
-def make_discordcolor(text: str) -> discord.Color:
-    hashed = str(int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % (10 ** 9))
-    r = int(hashed[:3]) % 100
-    g = int(hashed[3:6]) % 100
-    b = int(hashed[6:]) % 100
-
-    return discord.Color.from_rgb(r + 100, g + 100, b + 100)
-
-
 PAYMENT_TYPE: dict = {
     0: "其他",
     1: "轉帳",